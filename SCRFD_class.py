@@ -1,9 +1,15 @@
+import json
+import os
 import os.path as osp
+import time
+from collections import OrderedDict
 
 import cv2
 import numpy as np
 import onnxruntime
-import torch
+
+# Images the SCRFD scripts pick up from a folder
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
 
 
 def softmax(z):
@@ -16,56 +22,292 @@ def softmax(z):
     return e_x / div
 
 
+# Sign applied to (left, top, right, bottom) distances around an anchor point
+_BBOX_SIGNS = np.array([-1.0, -1.0, 1.0, 1.0], dtype=np.float32)
+
+
 def distance2bbox(points, distance, max_shape=None):
     """Decode distance prediction to bounding box.
 
     Args:
-        points (Tensor): Shape (n, 2), [x, y].
-        distance (Tensor): Distance from the given point to 4
+        points (ndarray): Shape (n, 2), [x, y].
+        distance (ndarray): Distance from the given point to 4
             boundaries (left, top, right, bottom).
         max_shape (tuple): Shape of the image.
 
     Returns:
-        Tensor: Decoded bboxes.
+        ndarray: Decoded bboxes, shape (n, 4).
     """
-    x1 = points[:, 0] - distance[:, 0]
-    y1 = points[:, 1] - distance[:, 1]
-    x2 = points[:, 0] + distance[:, 2]
-    y2 = points[:, 1] + distance[:, 3]
+    bboxes = points[:, [0, 1, 0, 1]] + distance[:, :4] * _BBOX_SIGNS
     if max_shape is not None:
-        x1 = x1.clamp(min=0, max=max_shape[1])
-        y1 = y1.clamp(min=0, max=max_shape[0])
-        x2 = x2.clamp(min=0, max=max_shape[1])
-        y2 = y2.clamp(min=0, max=max_shape[0])
-    return np.stack([x1, y1, x2, y2], axis=-1)
+        np.clip(bboxes[:, 0::2], 0, max_shape[1], out=bboxes[:, 0::2])
+        np.clip(bboxes[:, 1::2], 0, max_shape[0], out=bboxes[:, 1::2])
+    return bboxes
 
 
 def distance2kps(points, distance, max_shape=None):
-    """Decode distance prediction to bounding box.
+    """Decode distance prediction to keypoints.
 
     Args:
-        points (Tensor): Shape (n, 2), [x, y].
-        distance (Tensor): Distance from the given point to 4
-            boundaries (left, top, right, bottom).
+        points (ndarray): Shape (n, 2), [x, y].
+        distance (ndarray): Offsets from the given point to each
+            keypoint, shape (n, 2 * num_kps), [x0, y0, x1, y1, ...].
         max_shape (tuple): Shape of the image.
 
     Returns:
-        Tensor: Decoded bboxes.
+        ndarray: Decoded keypoints, shape (n, 2 * num_kps).
     """
-    preds = []
-    for i in range(0, distance.shape[1], 2):
-        px = points[:, i % 2] + distance[:, i]
-        py = points[:, i % 2 + 1] + distance[:, i + 1]
-        if max_shape is not None:
-            px = px.clamp(min=0, max=max_shape[1])
-            py = py.clamp(min=0, max=max_shape[0])
-        preds.append(px)
-        preds.append(py)
-    return np.stack(preds, axis=-1)
+    num_kps = distance.shape[1] // 2
+    kps = distance.reshape((-1, num_kps, 2)) + points[:, np.newaxis, :]
+    if max_shape is not None:
+        np.clip(kps[..., 0], 0, max_shape[1], out=kps[..., 0])
+        np.clip(kps[..., 1], 0, max_shape[0], out=kps[..., 1])
+    return kps.reshape((-1, num_kps * 2))
+
+
+def box_iou(boxes_a, boxes_b):
+    """Pairwise IoU between (n, 4) and (m, 4) boxes in x1, y1, x2, y2."""
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    x1 = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    y1 = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    x2 = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    y2 = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    inter = np.maximum(0.0, x2 - x1) * np.maximum(0.0, y2 - y1)
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+
+def nms_reference(dets, thresh):
+    """Greedy NMS, one suppression pass per kept box.
+
+    Args:
+        dets (ndarray): Shape (n, 5), [x1, y1, x2, y2, score].
+        thresh (float): IoU above which a lower-scored box is dropped.
+
+    Returns:
+        list: Indices of kept boxes, highest score first.
+    """
+    x1 = dets[:, 0]
+    y1 = dets[:, 1]
+    x2 = dets[:, 2]
+    y2 = dets[:, 3]
+    scores = dets[:, 4]
+
+    areas = (x2 - x1 + 1) * (y2 - y1 + 1)
+    order = scores.argsort()[::-1]
+
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        xx1 = np.maximum(x1[i], x1[order[1:]])
+        yy1 = np.maximum(y1[i], y1[order[1:]])
+        xx2 = np.minimum(x2[i], x2[order[1:]])
+        yy2 = np.minimum(y2[i], y2[order[1:]])
+
+        w = np.maximum(0.0, xx2 - xx1 + 1)
+        h = np.maximum(0.0, yy2 - yy1 + 1)
+        inter = w * h
+        ovr = inter / (areas[i] + areas[order[1:]] - inter)
+
+        inds = np.where(ovr <= thresh)[0]
+        order = order[inds + 1]
+
+    return keep
+
+
+def nms_matrix(dets, thresh):
+    """Greedy NMS over a precomputed pairwise IoU matrix.
+
+    Computes all IoUs in one broadcast, then walks the sorted boxes with a
+    boolean suppression mask. Memory is O(n^2), so keep it for small n.
+    """
+    order = dets[:, 4].argsort()[::-1]
+    boxes = dets[order, :4]
+    x1 = boxes[:, 0]
+    y1 = boxes[:, 1]
+    x2 = boxes[:, 2]
+    y2 = boxes[:, 3]
+    areas = (x2 - x1 + 1) * (y2 - y1 + 1)
+
+    w = np.maximum(
+        0.0, np.minimum(x2[:, None], x2[None, :]) - np.maximum(x1[:, None], x1[None, :]) + 1
+    )
+    h = np.maximum(
+        0.0, np.minimum(y2[:, None], y2[None, :]) - np.maximum(y1[:, None], y1[None, :]) + 1
+    )
+    inter = w * h
+    ovr = inter / (areas[:, None] + areas[None, :] - inter)
+
+    suppressed = np.zeros(len(order), dtype=bool)
+    keep = []
+    for i in range(len(order)):
+        if suppressed[i]:
+            continue
+        keep.append(order[i])
+        suppressed |= ovr[i] > thresh
+    return keep
+
+
+def nms_cv2(dets, thresh):
+    """NMS through cv2.dnn.NMSBoxes.
+
+    Widths and heights get the same +1 pixel convention as nms_reference so
+    both engines agree on which boxes overlap.
+    """
+    if dets.shape[0] == 0:
+        return []
+    boxes = np.empty((dets.shape[0], 4), dtype=np.float64)
+    boxes[:, 0:2] = dets[:, 0:2]
+    boxes[:, 2:4] = dets[:, 2:4] - dets[:, 0:2] + 1
+    # NMSBoxes drops scores <= score_threshold and rejects negative thresholds,
+    # so shift scores up by one to keep every candidate
+    keep = cv2.dnn.NMSBoxes(
+        boxes.tolist(), (dets[:, 4] + 1.0).tolist(), score_threshold=0.0, nms_threshold=thresh
+    )
+    return list(np.asarray(keep, dtype=np.int64).reshape(-1))
+
+
+def nms_batched(dets, group_ids, thresh, nms_fn=nms_reference):
+    """Class-aware NMS: boxes only suppress others with the same group id.
+
+    Each group is shifted to its own disjoint coordinate range so a single
+    nms_fn call handles every group, e.g. all images of a detect_batch call.
+    """
+    if dets.shape[0] == 0:
+        return []
+    # float64 so the shift doesn't cost float32 precision in the IoU
+    shifted = dets.astype(np.float64)
+    offset = shifted[:, :4].max() - min(shifted[:, :4].min(), 0) + 2
+    shifted[:, :4] += (group_ids * offset)[:, None]
+    return nms_fn(shifted, thresh)
+
+
+NMS_BACKENDS = {
+    "reference": nms_reference,
+    "matrix": nms_matrix,
+    "cv2": nms_cv2,
+}
+
+# Above this many candidates cv2.dnn.NMSBoxes beats building the IoU matrix
+NMS_MATRIX_MAX_CANDIDATES = 32
+
+
+def select_nms_backend(num_candidates):
+    if num_candidates <= NMS_MATRIX_MAX_CANDIDATES:
+        return nms_matrix
+    if hasattr(cv2, "dnn") and hasattr(cv2.dnn, "NMSBoxes"):
+        return nms_cv2
+    return nms_reference
+
+
+GRAPH_OPT_LEVELS = {
+    "disable": onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+EXECUTION_MODES = {
+    "sequential": onnxruntime.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": onnxruntime.ExecutionMode.ORT_PARALLEL,
+}
+
+
+def make_session_options(
+    intra_op_num_threads=None,
+    inter_op_num_threads=None,
+    graph_optimization_level="all",
+    execution_mode="sequential",
+    enable_cpu_mem_arena=True,
+    enable_mem_pattern=True,
+    allow_spinning=True,
+    optimized_model_filepath=None,
+):
+    """Build onnxruntime.SessionOptions from plain keyword settings.
+
+    Thread counts of None (or 0) leave the ONNX Runtime default of one
+    thread per core. When several detector processes share a host, set
+    intra_op_num_threads to cores / processes and allow_spinning=False so
+    idle workers don't busy-wait on each other's cores.
+
+    optimized_model_filepath makes ONNX Runtime serialize the optimized
+    graph there; see create_session() for loading it back.
+    """
+    options = onnxruntime.SessionOptions()
+    if intra_op_num_threads:
+        options.intra_op_num_threads = intra_op_num_threads
+    if inter_op_num_threads:
+        options.inter_op_num_threads = inter_op_num_threads
+    options.graph_optimization_level = GRAPH_OPT_LEVELS[graph_optimization_level]
+    options.execution_mode = EXECUTION_MODES[execution_mode]
+    options.enable_cpu_mem_arena = enable_cpu_mem_arena
+    options.enable_mem_pattern = enable_mem_pattern
+    if not allow_spinning:
+        options.add_session_config_entry("session.intra_op.allow_spinning", "0")
+        options.add_session_config_entry("session.inter_op.allow_spinning", "0")
+    if optimized_model_filepath is not None:
+        options.optimized_model_filepath = optimized_model_filepath
+    return options
+
+
+def _model_signature(model_file):
+    stat = os.stat(model_file)
+    return {"path": osp.abspath(model_file), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _read_signature(signature_file):
+    try:
+        with open(signature_file) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def create_session(model_file, providers=None, optimized_model_filepath=None, **options):
+    """Create an InferenceSession, reusing a cached optimized model if present.
+
+    On the first run the optimized graph is written to
+    optimized_model_filepath, with the source model's path, size and mtime
+    in <optimized_model_filepath>.source.json; later runs load it with graph
+    optimizations disabled, skipping the optimization pass at startup. The
+    cache is rebuilt if model_file no longer matches that record.
+    With level "all" the cached graph can be hardware specific, so keep the
+    cache file per machine type.
+    """
+    if optimized_model_filepath is None:
+        return onnxruntime.InferenceSession(model_file, make_session_options(**options), providers=providers)
+
+    signature_file = optimized_model_filepath + ".source.json"
+    signature = _model_signature(model_file)
+    if osp.exists(optimized_model_filepath) and _read_signature(signature_file) == signature:
+        options["graph_optimization_level"] = "disable"
+        return onnxruntime.InferenceSession(
+            optimized_model_filepath, make_session_options(**options), providers=providers
+        )
+
+    session = onnxruntime.InferenceSession(
+        model_file,
+        make_session_options(optimized_model_filepath=optimized_model_filepath, **options),
+        providers=providers,
+    )
+    with open(signature_file, "w") as f:
+        json.dump(signature, f)
+    return session
 
 
 class SCRFD:
-    def __init__(self, model_file=None, session=None):
+    def __init__(self, model_file=None, session=None, providers=None, **session_options):
+        """
+        Args:
+            model_file (str): Path to the SCRFD ONNX model.
+            session (InferenceSession): Prebuilt session, used as is.
+            providers (list): Execution providers, e.g. ["CPUExecutionProvider"].
+            **session_options: Passed to create_session(), e.g.
+                intra_op_num_threads=2, optimized_model_filepath="scrfd.opt.onnx".
+        """
         self.model_file = model_file
         self.session = session
         self.taskname = "detection"
@@ -73,9 +315,23 @@ class SCRFD:
         if self.session is None:
             assert self.model_file is not None
             assert osp.exists(self.model_file)
-            self.session = onnxruntime.InferenceSession(self.model_file, None)
-        self.center_cache = {}
+            self.session = create_session(
+                self.model_file, providers=providers, **session_options
+            )
+        # LRU of anchor centers keyed by (feat height, feat width, stride)
+        self.center_cache = OrderedDict()
+        self.center_cache_size = 100
+        # Candidate sizes for input_size="auto", smallest first
+        self.auto_input_sizes = [(160, 160), (320, 320), (480, 480), (640, 640)]
+        # Smallest face (source pixels) that "auto" must keep detectable
+        self.min_face_size = 40
+        # Smallest face (input pixels) SCRFD detects reliably: the stride 8 anchor
+        self.min_detectable_face = 16
         self.nms_thresh = 0.4
+        self.nms_backend = "auto"
+        self.use_iobinding = False
+        # Preallocated letterbox canvases / input blobs keyed by (input_size, batch)
+        self._prep_buffers = {}
 
         self._init_vars()
 
@@ -86,6 +342,11 @@ class SCRFD:
             self.input_size = None
         else:
             self.input_size = tuple(input_shape[2:4][::-1])
+        # Fixed batch dimension (e.g. 1) limits how many frames fit in one run
+        if isinstance(input_shape[0], int) and input_shape[0] > 0:
+            self.max_batch_size = input_shape[0]
+        else:
+            self.max_batch_size = None
         input_name = input_cfg.name
         outputs = self.session.get_outputs()
         if len(outputs[0].shape) == 3:
@@ -122,142 +383,223 @@ class SCRFD:
         nms_thresh = kwargs.get("nms_thresh", None)
         if nms_thresh is not None:
             self.nms_thresh = nms_thresh
+        nms_backend = kwargs.get("nms_backend", None)
+        if nms_backend is not None:
+            assert nms_backend == "auto" or nms_backend in NMS_BACKENDS
+            self.nms_backend = nms_backend
+        use_iobinding = kwargs.get("use_iobinding", None)
+        if use_iobinding is not None:
+            self.use_iobinding = use_iobinding
+            # Bindings hold the previous providers' state, rebuild lazily
+            for buffers in self._prep_buffers.values():
+                buffers["binding"] = None
         input_size = kwargs.get("input_size", None)
         if input_size is not None:
             if self.input_size is not None:
                 print("warning: det_size is already set in scrfd model, ignore")
             else:
                 self.input_size = input_size
+        min_face_size = kwargs.get("min_face_size", None)
+        if min_face_size is not None:
+            self.min_face_size = min_face_size
+        center_cache_size = kwargs.get("center_cache_size", None)
+        if center_cache_size is not None:
+            self.center_cache_size = center_cache_size
+            while len(self.center_cache) > self.center_cache_size:
+                self.center_cache.popitem(last=False)
+        input_sizes = kwargs.get("input_sizes", None)
+        if input_sizes is not None:
+            self.auto_input_sizes = sorted(
+                (tuple(size) for size in input_sizes), key=lambda size: size[0] * size[1]
+            )
+            self.prewarm(self.auto_input_sizes)
+
+    def prewarm(self, input_sizes):
+        """Fill the anchor cache and preprocessing buffers for these input sizes."""
+        for input_size in input_sizes:
+            width, height = input_size
+            for stride in self._feat_stride_fpn:
+                self._anchor_centers(height // stride, width // stride, stride)
+            self._get_buffers(input_size)
+
+    def select_input_size(self, image_shape, min_face_size=None):
+        """Smallest auto input size that keeps min_face_size faces detectable.
+
+        A face of min_face_size source pixels shrinks by the letterbox scale;
+        pick the first candidate where it still spans min_detectable_face
+        input pixels, or the largest candidate if none does.
+        """
+        if self.input_size is not None:
+            return self.input_size
+        min_face_size = self.min_face_size if min_face_size is None else min_face_size
+        height, width = image_shape[:2]
+        for input_size in self.auto_input_sizes:
+            scale = min(float(input_size[0]) / width, float(input_size[1]) / height)
+            if min_face_size * scale >= self.min_detectable_face:
+                return input_size
+        return self.auto_input_sizes[-1]
+
+    def _resolve_input_size(self, input_size, images):
+        assert input_size is not None or self.input_size is not None
+        if input_size is None:
+            return self.input_size
+        if input_size == "auto":
+            # One blob per batch, so the most demanding image decides
+            sizes = [self.select_input_size(image.shape) for image in images]
+            return max(sizes, key=lambda size: size[0] * size[1])
+        return input_size
+
+    def _anchor_centers(self, height, width, stride):
+        key = (height, width, stride)
+        anchor_centers = self.center_cache.get(key)
+        if anchor_centers is not None:
+            self.center_cache.move_to_end(key)
+            return anchor_centers
+
+        anchor_centers = np.stack(np.mgrid[:height, :width][::-1], axis=-1).astype(
+            np.float32
+        )
+        anchor_centers = (anchor_centers * stride).reshape((-1, 2))
+        if self._num_anchors > 1:
+            anchor_centers = np.stack(
+                [anchor_centers] * self._num_anchors, axis=1
+            ).reshape((-1, 2))
+        self.center_cache[key] = anchor_centers
+        if len(self.center_cache) > self.center_cache_size:
+            self.center_cache.popitem(last=False)
+        return anchor_centers
 
     def forward(self, img, thresh):
-        scores_list = []
-        bboxes_list = []
-        kpss_list = []
         input_size = tuple(img.shape[0:2][::-1])
         blob = cv2.dnn.blobFromImage(
             img, 1.0 / 128, input_size, (127.5, 127.5, 127.5), swapRB=True
         )
         net_outs = self.session.run(self.output_names, {self.input_name: blob})
-
-        input_height = blob.shape[2]
-        input_width = blob.shape[3]
+        return self._decode_outputs(net_outs, blob.shape[2], blob.shape[3], thresh)
+
+    def _get_buffers(self, input_size, batch_size=1):
+        key = (tuple(input_size), batch_size)
+        buffers = self._prep_buffers.get(key)
+        if buffers is None:
+            width, height = input_size
+            buffers = {
+                "canvas": np.zeros((batch_size, height, width, 3), dtype=np.uint8),
+                "blob": np.empty((batch_size, 3, height, width), dtype=np.float32),
+                "binding": None,
+            }
+            self._prep_buffers[key] = buffers
+        return buffers
+
+    def _preprocess(self, images, input_size, batch_size=None):
+        """Letterbox images into a cached canvas and normalize into a cached blob.
+
+        The returned blob is reused by the next call with the same input size
+        and batch size, so consume it before preprocessing again.
+
+        Returns:
+            tuple: (buffers, det_scales) where buffers["blob"] is NCHW float32.
+        """
+        batch_size = len(images) if batch_size is None else batch_size
+        buffers = self._get_buffers(input_size, batch_size)
+        canvas = buffers["canvas"]
+        det_scales = []
+        for i, image in enumerate(images):
+            im_ratio = float(image.shape[0]) / image.shape[1]
+            model_ratio = float(input_size[1]) / input_size[0]
+            if im_ratio > model_ratio:
+                new_height = input_size[1]
+                new_width = int(new_height / im_ratio)
+            else:
+                new_width = input_size[0]
+                new_height = int(new_width * im_ratio)
+            det_scales.append(float(new_height) / image.shape[0])
+            # Resize straight into the canvas and only clear the padding
+            cv2.resize(image, (new_width, new_height), dst=canvas[i, :new_height, :new_width])
+            canvas[i, new_height:, :, :] = 0
+            canvas[i, :new_height, new_width:, :] = 0
+        # Unused slots of a fixed-size batch stay as blank frames
+        canvas[len(images) :] = 0
+
+        # Same as blobFromImage(img, 1/128, mean=127.5, swapRB=True), in place
+        blob = buffers["blob"]
+        np.copyto(blob, canvas[..., ::-1].transpose(0, 3, 1, 2))
+        blob -= 127.5
+        blob *= 1.0 / 128
+        return buffers, det_scales
+
+    def _run(self, buffers):
+        if not self.use_iobinding:
+            return self.session.run(self.output_names, {self.input_name: buffers["blob"]})
+        binding = buffers["binding"]
+        if binding is None:
+            # The blob never moves, so the input only has to be bound once
+            binding = self.session.io_binding()
+            binding.bind_cpu_input(self.input_name, buffers["blob"])
+            for name in self.output_names:
+                binding.bind_output(name)
+            buffers["binding"] = binding
+        self.session.run_with_iobinding(binding)
+        return binding.copy_outputs_to_cpu()
+
+    def _decode_outputs(self, net_outs, input_height, input_width, thresh, batch_idx=0):
+        scores_list = []
+        bboxes_list = []
+        kpss_list = []
         fmc = self.fmc
         for idx, stride in enumerate(self._feat_stride_fpn):
-            # If model support batch dim, take first output
+            # If model support batch dim, take the requested batch element
             if self.batched:
-                scores = net_outs[idx][0]
-                bbox_preds = net_outs[idx + fmc][0]
-                bbox_preds = bbox_preds * stride
+                scores = net_outs[idx][batch_idx]
+                bbox_preds = net_outs[idx + fmc][batch_idx]
                 if self.use_kps:
-                    kps_preds = net_outs[idx + fmc * 2][0] * stride
+                    kps_preds = net_outs[idx + fmc * 2][batch_idx]
             # If model doesn't support batching take output as is
             else:
                 scores = net_outs[idx]
                 bbox_preds = net_outs[idx + fmc]
-                bbox_preds = bbox_preds * stride
                 if self.use_kps:
-                    kps_preds = net_outs[idx + fmc * 2] * stride
-
-            height = input_height // stride
-            width = input_width // stride
-            K = height * width
-            key = (height, width, stride)
-            if key in self.center_cache:
-                anchor_centers = self.center_cache[key]
-            else:
-                anchor_centers = np.stack(
-                    np.mgrid[:height, :width][::-1], axis=-1
-                ).astype(np.float32)
-
-                anchor_centers = (anchor_centers * stride).reshape((-1, 2))
-                if self._num_anchors > 1:
-                    anchor_centers = np.stack(
-                        [anchor_centers] * self._num_anchors, axis=1
-                    ).reshape((-1, 2))
-                if len(self.center_cache) < 100:
-                    self.center_cache[key] = anchor_centers
+                    kps_preds = net_outs[idx + fmc * 2]
+
+            anchor_centers = self._anchor_centers(
+                input_height // stride, input_width // stride, stride
+            )
 
+            # Filter by score first so only surviving anchors get decoded
             pos_inds = np.where(scores >= thresh)[0]
-            bboxes = distance2bbox(anchor_centers, bbox_preds)
+            pos_centers = anchor_centers[pos_inds]
             pos_scores = scores[pos_inds]
-            pos_bboxes = bboxes[pos_inds]
+            pos_bboxes = distance2bbox(pos_centers, bbox_preds[pos_inds] * stride)
             scores_list.append(pos_scores)
             bboxes_list.append(pos_bboxes)
             if self.use_kps:
-                kpss = distance2kps(anchor_centers, kps_preds)
-                # kpss = kps_preds
-                kpss = kpss.reshape((kpss.shape[0], -1, 2))
-                pos_kpss = kpss[pos_inds]
+                pos_kpss = distance2kps(pos_centers, kps_preds[pos_inds] * stride)
+                pos_kpss = pos_kpss.reshape((-1, pos_kpss.shape[1] // 2, 2))
                 kpss_list.append(pos_kpss)
         return scores_list, bboxes_list, kpss_list
 
-    def nms(self, dets):
-        thresh = self.nms_thresh
-        x1 = dets[:, 0]
-        y1 = dets[:, 1]
-        x2 = dets[:, 2]
-        y2 = dets[:, 3]
-        scores = dets[:, 4]
-
-        areas = (x2 - x1 + 1) * (y2 - y1 + 1)
-        order = scores.argsort()[::-1]
-
-        keep = []
-        while order.size > 0:
-            i = order[0]
-            keep.append(i)
-            xx1 = np.maximum(x1[i], x1[order[1:]])
-            yy1 = np.maximum(y1[i], y1[order[1:]])
-            xx2 = np.minimum(x2[i], x2[order[1:]])
-            yy2 = np.minimum(y2[i], y2[order[1:]])
-
-            w = np.maximum(0.0, xx2 - xx1 + 1)
-            h = np.maximum(0.0, yy2 - yy1 + 1)
-            inter = w * h
-            ovr = inter / (areas[i] + areas[order[1:]] - inter)
-
-            inds = np.where(ovr <= thresh)[0]
-            order = order[inds + 1]
-
-        return keep
+    def _nms_fn(self, num_candidates):
+        if self.nms_backend == "auto":
+            return select_nms_backend(num_candidates)
+        return NMS_BACKENDS[self.nms_backend]
 
-    def detect(
-        self, image, thresh=0.5, input_size=(128, 128), max_num=0, metric="default"
-    ):
-        assert input_size is not None or self.input_size is not None
-
-        input_size = self.input_size if input_size is None else input_size
-
-        im_ratio = float(image.shape[0]) / image.shape[1]
-        model_ratio = float(input_size[1]) / input_size[0]
-        if im_ratio > model_ratio:
-            new_height = input_size[1]
-            new_width = int(new_height / im_ratio)
-        else:
-            new_width = input_size[0]
-            new_height = int(new_width * im_ratio)
-        det_scale = float(new_height) / image.shape[0]
-        resized_img = cv2.resize(image, (new_width, new_height))
-        det_img = np.zeros((input_size[1], input_size[0], 3), dtype=np.uint8)
-        det_img[:new_height, :new_width, :] = resized_img
-
-        scores_list, bboxes_list, kpss_list = self.forward(det_img, thresh)
+    def nms(self, dets):
+        return self._nms_fn(dets.shape[0])(dets, self.nms_thresh)
 
+    def _pre_nms(self, det_scale, scores_list, bboxes_list, kpss_list):
         scores = np.vstack(scores_list)
         scores_ravel = scores.ravel()
         order = scores_ravel.argsort()[::-1]
         bboxes = np.vstack(bboxes_list) / det_scale
-        if self.use_kps:
-            kpss = np.vstack(kpss_list) / det_scale
         pre_det = np.hstack((bboxes, scores)).astype(np.float32, copy=False)
         pre_det = pre_det[order, :]
-        keep = self.nms(pre_det)
-        det = pre_det[keep, :]
         if self.use_kps:
+            kpss = np.vstack(kpss_list) / det_scale
             kpss = kpss[order, :, :]
-            kpss = kpss[keep, :, :]
         else:
             kpss = None
+        return pre_det, kpss
+
+    def _post_nms(self, image, det, kpss, max_num, metric):
         if max_num > 0 and det.shape[0] > max_num:
             area = (det[:, 2] - det[:, 0]) * (det[:, 3] - det[:, 1])
             img_center = image.shape[0] // 2, image.shape[1] // 2
@@ -279,77 +621,241 @@ class SCRFD:
             det = det[bindex, :]
             if kpss is not None:
                 kpss = kpss[bindex, :]
+        return det, kpss
 
+    def _postprocess(
+        self, image, det_scale, scores_list, bboxes_list, kpss_list, max_num, metric
+    ):
+        pre_det, kpss = self._pre_nms(det_scale, scores_list, bboxes_list, kpss_list)
+        keep = self.nms(pre_det)
+        det = pre_det[keep, :]
+        if kpss is not None:
+            kpss = kpss[keep, :, :]
+        return self._post_nms(image, det, kpss, max_num, metric)
+
+    def detect(
+        self, image, thresh=0.5, input_size=(128, 128), max_num=0, metric="default"
+    ):
+        input_size = self._resolve_input_size(input_size, [image])
+
+        buffers, (det_scale,) = self._preprocess([image], input_size)
+        net_outs = self._run(buffers)
+        height, width = buffers["blob"].shape[2:4]
+        scores_list, bboxes_list, kpss_list = self._decode_outputs(
+            net_outs, height, width, thresh
+        )
+
+        det, kpss = self._postprocess(
+            image, det_scale, scores_list, bboxes_list, kpss_list, max_num, metric
+        )
         bboxes = np.int32(det)
         landmarks = np.int32(kpss)
 
         return bboxes, landmarks
 
+    def detect_batch(
+        self,
+        images,
+        thresh=0.5,
+        input_size=(128, 128),
+        max_num=0,
+        metric="default",
+        batch_size=None,
+    ):
+        """Detect faces in several images with one session.run per batch.
+
+        Every image is letterboxed to the same input size and stacked into a
+        single NCHW blob. Models without a batch dimension fall back to
+        calling detect() once per image. input_size="auto" picks one size
+        for the whole call via select_input_size().
+
+        Returns:
+            list: One (bboxes, landmarks) tuple per input image.
+        """
+        if len(images) == 0:
+            return []
+        input_size = self._resolve_input_size(input_size, images)
+
+        if not self.batched or self.max_batch_size == 1:
+            return [
+                self.detect(image, thresh, input_size, max_num, metric)
+                for image in images
+            ]
+
+        if batch_size is None:
+            batch_size = self.max_batch_size or len(images)
+        elif self.max_batch_size is not None:
+            batch_size = min(batch_size, self.max_batch_size)
+
+        results = []
+        for start in range(0, len(images), batch_size):
+            chunk = images[start : start + batch_size]
+            # Models exported with a fixed batch size need a full blob
+            blob_batch = self.max_batch_size or len(chunk)
+            buffers, det_scales = self._preprocess(chunk, input_size, blob_batch)
+            net_outs = self._run(buffers)
+            height, width = buffers["blob"].shape[2:4]
+            pre_nms = [
+                self._pre_nms(
+                    det_scale,
+                    *self._decode_outputs(net_outs, height, width, thresh, b),
+                )
+                for b, det_scale in enumerate(det_scales)
+            ]
+            # One class-aware NMS call for the whole batch, grouped by image
+            pre_dets = np.vstack([pre_det for pre_det, _ in pre_nms])
+            group_ids = np.concatenate(
+                [np.full(len(pre_det), i) for i, (pre_det, _) in enumerate(pre_nms)]
+            )
+            keep = np.asarray(
+                nms_batched(
+                    pre_dets, group_ids, self.nms_thresh, self._nms_fn(len(pre_dets))
+                ),
+                dtype=np.int64,
+            )
+            keep_groups = group_ids[keep]
+            start_inds = np.cumsum([0] + [len(pre_det) for pre_det, _ in pre_nms])
+            for i, (image, (pre_det, kpss)) in enumerate(zip(chunk, pre_nms)):
+                # keep is score-ordered, so per-image order matches self.nms
+                img_keep = keep[keep_groups == i] - start_inds[i]
+                det = pre_det[img_keep, :]
+                if kpss is not None:
+                    kpss = kpss[img_keep, :, :]
+                det, kpss = self._post_nms(image, det, kpss, max_num, metric)
+                results.append((np.int32(det), np.int32(kpss)))
+        return results
+
     def detect_tracking(
-        self, image, thresh=0.5, input_size=(128, 128), max_num=0, metric="default"
+        self,
+        image,
+        thresh=0.5,
+        input_size=(128, 128),
+        max_num=0,
+        metric="default",
+        return_numpy=False,
     ):
-        assert input_size is not None or self.input_size is not None
+        """Detect faces for a ByteTrack-style tracker.
+
+        Returns (det, img_info, bboxes, landmarks) where det holds
+        [x1, y1, x2, y2, score] rows in letterboxed input coordinates, as a
+        torch tensor by default or as a numpy array with return_numpy=True.
+        torch is only imported when a tensor is requested.
+        """
         height, width = image.shape[:2]
         img_info = {"id": 0}
         img_info["height"] = height
         img_info["width"] = width
         img_info["raw_img"] = image
 
-        input_size = self.input_size if input_size is None else input_size
+        input_size = self._resolve_input_size(input_size, [image])
 
-        im_ratio = float(image.shape[0]) / image.shape[1]
-        model_ratio = float(input_size[1]) / input_size[0]
-        if im_ratio > model_ratio:
-            new_height = input_size[1]
-            new_width = int(new_height / im_ratio)
-        else:
-            new_width = input_size[0]
-            new_height = int(new_width * im_ratio)
-        det_scale = float(new_height) / image.shape[0]
-        resized_img = cv2.resize(image, (new_width, new_height))
-        det_img = np.zeros((input_size[1], input_size[0], 3), dtype=np.uint8)
-        det_img[:new_height, :new_width, :] = resized_img
-
-        scores_list, bboxes_list, kpss_list = self.forward(det_img, thresh)
+        buffers, (det_scale,) = self._preprocess([image], input_size)
+        net_outs = self._run(buffers)
+        input_height, input_width = buffers["blob"].shape[2:4]
+        scores_list, bboxes_list, kpss_list = self._decode_outputs(
+            net_outs, input_height, input_width, thresh
+        )
 
-        scores = np.vstack(scores_list)
-        scores_ravel = scores.ravel()
-        order = scores_ravel.argsort()[::-1]
-        bboxes = np.vstack(bboxes_list)
-        if self.use_kps:
-            kpss = np.vstack(kpss_list)
-        pre_det = np.hstack((bboxes, scores)).astype(np.float32, copy=False)
-        pre_det = pre_det[order, :]
-        keep = self.nms(pre_det)
-        det = pre_det[keep, :]
-        if self.use_kps:
-            kpss = kpss[order, :, :]
-            kpss = kpss[keep, :, :]
-        else:
-            kpss = None
-        if max_num > 0 and det.shape[0] > max_num:
-            area = (det[:, 2] - det[:, 0]) * (det[:, 3] - det[:, 1])
-            img_center = image.shape[0] // 2, image.shape[1] // 2
-            offsets = np.vstack(
-                [
-                    (det[:, 0] + det[:, 2]) / 2 - img_center[1],
-                    (det[:, 1] + det[:, 3]) / 2 - img_center[0],
-                ]
-            )
-            offset_dist_squared = np.sum(np.power(offsets, 2.0), 0)
-            if metric == "max":
-                values = area
-            else:
-                values = (
-                    area - offset_dist_squared * 2.0
-                )  # some extra weight on the centering
-            bindex = np.argsort(values)[::-1]  # some extra weight on the centering
-            bindex = bindex[0:max_num]
-            det = det[bindex, :]
-            if kpss is not None:
-                kpss = kpss[bindex, :]
+        # The tracker wants detections in letterboxed input coordinates
+        det, kpss = self._postprocess(
+            image, 1.0, scores_list, bboxes_list, kpss_list, max_num, metric
+        )
 
         bboxes = np.int32(det / det_scale)
         landmarks = np.int32(kpss / det_scale)
 
-        return torch.tensor(det), img_info, bboxes, landmarks
+        if not return_numpy:
+            import torch
+
+            det = torch.tensor(det)
+        return det, img_info, bboxes, landmarks
+
+
+def _latency_stats(latencies):
+    latencies = np.asarray(latencies) * 1000.0
+    return {
+        "mean_ms": float(latencies.mean()),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p90_ms": float(np.percentile(latencies, 90)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+
+def benchmark(
+    model_file,
+    image,
+    configs=None,
+    input_size=(640, 640),
+    runs=50,
+    warmup=5,
+    providers=None,
+):
+    """Time SCRFD.detect on one image for several session configurations.
+
+    Args:
+        model_file (str): Path to the SCRFD ONNX model.
+        image (ndarray): BGR sample image.
+        configs (list): Dicts of create_session() keyword arguments. Defaults
+            to a sweep over intra-op thread counts and execution modes.
+        input_size (tuple): Detector input (width, height).
+        runs (int): Timed detect() calls per configuration.
+        warmup (int): Untimed calls before measuring.
+
+    Returns:
+        list: One dict per config with the settings and latency percentiles.
+    """
+    if configs is None:
+        configs = [
+            {"intra_op_num_threads": threads, "execution_mode": mode}
+            for threads in (1, 2, 4)
+            for mode in ("sequential", "parallel")
+        ]
+
+    results = []
+    for config in configs:
+        detector = SCRFD(model_file, providers=providers, **config)
+        for _ in range(warmup):
+            detector.detect(image, input_size=input_size)
+        latencies = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            detector.detect(image, input_size=input_size)
+            latencies.append(time.perf_counter() - start)
+        result = dict(config)
+        result.update(_latency_stats(latencies))
+        results.append(result)
+        print(
+            f"{config}: mean {result['mean_ms']:.2f} ms, p50 {result['p50_ms']:.2f} ms, "
+            f"p90 {result['p90_ms']:.2f} ms, p99 {result['p99_ms']:.2f} ms"
+        )
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="SCRFD throughput check")
+    parser.add_argument("model_file")
+    parser.add_argument("image")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--frames", type=int, default=64)
+    parser.add_argument("--input-size", type=int, nargs=2, default=[640, 640])
+    parser.add_argument(
+        "--sweep", action="store_true", help="benchmark session settings instead"
+    )
+    args = parser.parse_args()
+
+    frame = cv2.imread(args.image)
+    if args.sweep:
+        benchmark(args.model_file, frame, input_size=tuple(args.input_size))
+        raise SystemExit(0)
+
+    detector = SCRFD(args.model_file)
+    frames = [frame] * args.frames
+    input_size = tuple(args.input_size)
+    for batch_size in args.batch_sizes:
+        detector.detect_batch(frames[:batch_size], input_size=input_size)  # warm up
+        start = time.perf_counter()
+        detector.detect_batch(frames, input_size=input_size, batch_size=batch_size)
+        elapsed = time.perf_counter() - start
+        print(f"batch_size={batch_size}: {args.frames / elapsed:.1f} fps")
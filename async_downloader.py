@@ -0,0 +1,177 @@
+import asyncio
+import hashlib
+import os
+import random
+import time
+
+import aiohttp
+
+from bulkdownloadfromurls import read_urls_from_csv
+from blob_store import BlobStore
+from download_manifest import DownloadManifest, hash_file, part_is_complete, restart_plan
+from url_stream import iter_batches
+
+
+class RetryableError(Exception):
+    """A 5xx response or dropped connection worth retrying."""
+
+
+async def fetch_to_file(session, url, plan, manifest, store, timeout):
+    """Stream one URL to disk per a DownloadManifest plan.
+
+    Returns bytes received, or None if the server answered 304 Not Modified.
+    """
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    async with session.get(url, headers=plan["headers"], timeout=client_timeout) as response:
+        if response.status == 416 and plan["resume_from"]:
+            if part_is_complete(response.headers, plan["resume_from"]):
+                # The last run got every byte but stopped before committing
+                hasher = await asyncio.to_thread(hash_file, plan["part_path"])
+                await commit_part(url, plan, manifest, store, hasher,
+                                  response.headers.get("ETag"), response.headers.get("Last-Modified"))
+                return 0
+            # The file is now shorter than the .part, so start over
+            response.release()
+            await asyncio.to_thread(os.remove, plan["part_path"])
+            return await fetch_to_file(session, url, restart_plan(plan), manifest, store, timeout)
+        if response.status >= 500:
+            raise RetryableError(f"HTTP {response.status}")
+        if response.status == 304:
+            await asyncio.to_thread(manifest.mark_not_modified, url)
+            return None
+        response.raise_for_status()
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+
+        # 206 continues the partial file, anything else starts over
+        if response.status == 206 and plan["resume_from"]:
+            hasher = await asyncio.to_thread(hash_file, plan["part_path"])
+            mode = "ab"
+        else:
+            hasher = hashlib.sha256()
+            mode = "wb"
+        await asyncio.to_thread(manifest.mark_partial, url, plan["path"], etag, last_modified)
+
+        # File I/O goes to a thread so a slow disk never stalls the event loop
+        file = await asyncio.to_thread(open, plan["part_path"], mode)
+        received = 0
+        try:
+            async for chunk in response.content.iter_chunked(65536):
+                hasher.update(chunk)
+                await asyncio.to_thread(file.write, chunk)
+                received += len(chunk)
+        finally:
+            await asyncio.to_thread(file.close)
+
+    await commit_part(url, plan, manifest, store, hasher, etag, last_modified)
+    return received
+
+
+async def commit_part(url, plan, manifest, store, hasher, etag, last_modified):
+    size = await asyncio.to_thread(os.path.getsize, plan["part_path"])
+    content_hash = hasher.hexdigest()
+    path = await asyncio.to_thread(store.commit, plan["part_path"], content_hash)
+    await asyncio.to_thread(manifest.mark_done, url, path, content_hash, etag, last_modified, size)
+
+
+async def download_with_retries(
+    session, url, folder, manifest, store, stats, retries=3, backoff=0.5, timeout=30, max_age=None
+):
+    for attempt in range(retries + 1):
+        # Re-plan each attempt so a retry resumes whatever the last one wrote
+        plan = await asyncio.to_thread(manifest.plan, url, folder, max_age)
+        if plan["skip"]:
+            stats["skipped"] += 1
+            return
+        try:
+            received = await fetch_to_file(session, url, plan, manifest, store, timeout)
+            if received is None:
+                stats["not_modified"] += 1
+            else:
+                stats["bytes"] += received
+                stats["succeeded"] += 1
+            return
+        except (RetryableError, asyncio.TimeoutError, aiohttp.ClientConnectionError) as e:
+            if attempt == retries:
+                print(f"Failed to download {url} after {retries + 1} attempts: {e}")
+                await asyncio.to_thread(manifest.mark_failed, url, e)
+                break
+            # Exponential backoff with jitter so retries don't arrive in lockstep
+            await asyncio.sleep(backoff * (2 ** attempt) * (1 + random.random()))
+        except aiohttp.ClientError as e:
+            # 4xx and malformed URLs won't get better on retry
+            print(f"Failed to download {url}: {e}")
+            await asyncio.to_thread(manifest.mark_failed, url, e)
+            break
+    stats["failed"] += 1
+
+
+async def download_all(
+    urls, folder, concurrency=64, per_host=8, retries=3, backoff=0.5, timeout=30, max_age=None
+):
+    """Download URLs with at most `concurrency` requests in flight.
+
+    `urls` may be any iterable, such as url_stream.iter_urls over a huge
+    CSV. A fixed pool of worker tasks pulls from a bounded queue, so
+    memory stays flat however many URLs there are. The connector keeps
+    connections alive and caps connections per host at `per_host`.
+
+    Progress is kept in <folder>/manifest.sqlite: finished URLs are
+    skipped on rerun (or revalidated once older than max_age seconds) and
+    partial files resume with a Range request. Files are stored by
+    content hash, so an image behind several URLs is kept once, and
+    url_index.tsv maps each URL to its file.
+    """
+    os.makedirs(folder, exist_ok=True)
+    manifest = DownloadManifest(os.path.join(folder, "manifest.sqlite"))
+    store = BlobStore(folder)
+    stats = {"succeeded": 0, "skipped": 0, "not_modified": 0, "failed": 0, "bytes": 0}
+    work = asyncio.Queue(maxsize=concurrency * 4)
+
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=per_host, keepalive_timeout=30)
+    async with aiohttp.ClientSession(connector=connector) as session:
+
+        async def worker():
+            while True:
+                url = await work.get()
+                try:
+                    if url is None:
+                        return
+                    await download_with_retries(
+                        session, url, folder, manifest, store, stats, retries, backoff, timeout, max_age
+                    )
+                finally:
+                    work.task_done()
+
+        start = time.perf_counter()
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        # Pull URLs a batch at a time off the event loop, so reading a large
+        # CSV chunk never stalls downloads already in flight
+        batches = iter_batches(urls)
+        while (batch := await asyncio.to_thread(next, batches, None)) is not None:
+            for url in batch:
+                if isinstance(url, str) and url.strip():
+                    await work.put(url.strip())
+        for _ in workers:
+            await work.put(None)
+        await asyncio.gather(*workers)
+        elapsed = time.perf_counter() - start
+    await asyncio.to_thread(store.write_index, manifest)
+    manifest.close()
+
+    stats["seconds"] = elapsed
+    rate = stats["bytes"] / elapsed if elapsed > 0 else 0.0
+    print(
+        f"Downloaded {stats['succeeded']} files, {stats['skipped']} skipped, "
+        f"{stats['not_modified']} not modified, {stats['failed']} failed, "
+        f"{stats['bytes'] / 1e6:.1f} MB in {elapsed:.1f}s ({rate / 1e6:.2f} MB/s)"
+    )
+    return stats
+
+
+if __name__ == "__main__":
+    csv_file = "face_dataset.csv"
+    column_name = "Imagelink"
+    image_urls = read_urls_from_csv(csv_file, column_name)
+    output_folder = "downloaded_images"
+    asyncio.run(download_all(image_urls, output_folder))
@@ -0,0 +1,158 @@
+import csv
+import os
+import threading
+
+import cv2
+import numpy as np
+
+# Leading bytes of the image formats we download, to name blobs by content
+# rather than by whatever extension the URL happened to carry
+MAGIC_EXTENSIONS = (
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+    (b"BM", ".bmp"),
+)
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp")
+
+
+def sniff_extension(path, default=".jpg"):
+    with open(path, "rb") as f:
+        head = f.read(12)
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    for magic, extension in MAGIC_EXTENSIONS:
+        if head.startswith(magic):
+            return extension
+    return default
+
+
+class BlobStore:
+    """Content-addressed image folder: each distinct file is stored once as <sha256><ext>.
+
+    Downloads are hashed while they stream, so committing a finished
+    .part file is just a rename, or a delete when the same bytes already
+    came from another URL. Blobs sit flat in `root` so the face scripts
+    can keep listing the folder directly.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.lock = threading.Lock()
+        self.stats = {"stored": 0, "duplicates": 0, "bytes_saved": 0}
+
+    def blob_path(self, content_hash, extension):
+        return os.path.join(self.root, content_hash + extension)
+
+    def commit(self, part_path, content_hash):
+        """Move a fully downloaded file into the store; returns the blob path."""
+        path = self.blob_path(content_hash, sniff_extension(part_path))
+        with self.lock:
+            if os.path.exists(path):
+                self.stats["duplicates"] += 1
+                self.stats["bytes_saved"] += os.path.getsize(part_path)
+                os.remove(part_path)
+            else:
+                self.stats["stored"] += 1
+                os.replace(part_path, path)
+        return path
+
+    def write_index(self, manifest, index_path=None):
+        """Write url -> content hash -> blob path for every finished download as TSV."""
+        index_path = index_path or os.path.join(self.root, "url_index.tsv")
+        rows = manifest.completed()
+        with open(index_path + ".tmp", "w", newline="") as f:
+            writer = csv.writer(f, delimiter="\t")
+            writer.writerow(["url", "content_hash", "path"])
+            writer.writerows(rows)
+        os.replace(index_path + ".tmp", index_path)
+        print(
+            f"Blob store: {self.stats['stored']} new, {self.stats['duplicates']} duplicate downloads "
+            f"({self.stats['bytes_saved'] / 1e6:.1f} MB saved), index of {len(rows)} URLs at {index_path}"
+        )
+        return index_path
+
+
+def dhash(image, hash_size=8):
+    """64-bit difference hash: survives resizing, recompression and small edits."""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def find_near_duplicates(folder, max_distance=4, output_csv=None, chunk_size=65536):
+    """Group images whose dHashes differ in at most max_distance bits.
+
+    Exact copies are already collapsed by the blob store; this catches
+    the same picture re-encoded or resized by a CDN. Returns a list of
+    groups (lists of paths), largest first, and optionally writes them
+    as group,path rows to output_csv.
+
+    Hashes are matched through a faiss multi-index hash instead of
+    comparing all pairs. Each hash is split into max_distance + 1 bit
+    bands; two hashes within max_distance bits agree exactly on at least
+    one band, so only hashes sharing a band get a full Hamming check.
+    Queries go to the index chunk_size at a time.
+    """
+    # faiss is only needed for near-duplicate search
+    import faiss
+
+    paths = []
+    hashes = []
+    for name in sorted(os.listdir(folder)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        path = os.path.join(folder, name)
+        # Decoding at 1/8 scale is plenty for a 9x8 hash and much faster
+        image = cv2.imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+        if image is None:
+            continue
+        paths.append(path)
+        hashes.append(dhash(image))
+    if not paths:
+        return []
+
+    codes = np.array(hashes, dtype=np.uint64).view(np.uint8).reshape(-1, 8)
+    bands = max_distance + 1
+    if bands <= 64:
+        index = faiss.IndexBinaryMultiHash(64, bands, 64 // bands)
+    else:
+        index = faiss.IndexBinaryFlat(64)
+    index.add(codes)
+    parent = list(range(len(paths)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for start in range(0, len(codes), chunk_size):
+        # range_search keeps distances strictly below the radius
+        lims, _, neighbors = index.range_search(codes[start:start + chunk_size], max_distance + 1)
+        queries = start + np.repeat(np.arange(len(lims) - 1), np.diff(lims).astype(np.int64))
+        # Each pair is found from both ends (and every hash matches itself)
+        later = neighbors > queries
+        for i, j in zip(queries[later].tolist(), neighbors[later].tolist()):
+            parent[find(i)] = find(j)
+
+    groups = {}
+    for i, path in enumerate(paths):
+        groups.setdefault(find(i), []).append(path)
+    groups = sorted((group for group in groups.values() if len(group) > 1), key=len, reverse=True)
+
+    if output_csv:
+        with open(output_csv, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["group", "path"])
+            for group_id, group in enumerate(groups):
+                writer.writerows((group_id, path) for path in group)
+    print(f"Found {len(groups)} near-duplicate groups covering {sum(map(len, groups))} of {len(paths)} images")
+    return groups
+
+
+if __name__ == "__main__":
+    find_near_duplicates("downloaded_images", output_csv="downloaded_images/near_duplicates.csv")
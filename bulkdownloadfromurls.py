@@ -1,51 +1,51 @@
 import os
 import requests
-from urllib.parse import urlsplit, quote_plus
-import pandas as pd
+from blob_store import BlobStore
+from download_manifest import DownloadManifest, download_with_manifest
+from url_stream import iter_urls
 
 def read_urls_from_csv(csv_file, column_name):
     try:
-        # Read CSV file into a DataFrame
-        df = pd.read_csv(csv_file)
-        
-        # Extract URLs from specified column
-        urls = df[column_name].tolist()
-        
-        return urls
+        # Stream the column chunk by chunk (gzip and plain URL lists work too),
+        # skipping blanks and repeats, so downloads start right away
+        yield from iter_urls(csv_file, column_name)
     except Exception as e:
         print(f"Error reading URLs from CSV: {e}")
-        return []
 
 
-def download_image(url, folder):
+def download_image(url, folder, session=None, manifest=None, store=None):
+    # Without a session/manifest this behaves as a one-off download
+    session = session or requests.Session()
+    store = store or BlobStore(folder)
+    own_manifest = manifest is None
+    if own_manifest:
+        manifest = DownloadManifest(os.path.join(folder, "manifest.sqlite"))
     try:
-        # Send a GET request to the URL
-        response = requests.get(url, stream=True)
-        response.raise_for_status()  # Check if the request was successful
-        
-        # Generate a unique filename using the URL
-        filename = quote_plus(url)  # Encode URL to use as filename
-        filename = filename[:25]  # Limit filename length (optional)
-        filename = f"{filename}.jpg"  # Add file extension if needed
-        
-        # Create the output path
-        output_path = os.path.join(folder, filename)
-        
-        # Save the image to the specified folder
-        with open(output_path, 'wb') as file:
-            for chunk in response.iter_content(8192):
-                file.write(chunk)
-        
-        print(f"Downloaded: {url} to {output_path}")
+        # Skips finished URLs, resumes partial files and stores each distinct image once
+        result = download_with_manifest(session, url, folder, manifest, timeout=30, store=store)
+        if result == "downloaded":
+            print(f"Downloaded: {url} to {manifest.get(url)['path']}")
     except requests.exceptions.RequestException as e:
         print(f"Failed to download {url}: {e}")
+    finally:
+        if own_manifest:
+            manifest.close()
 
 def download_images_from_list(url_list, folder):
     # Create the output folder if it doesn't exist
     os.makedirs(folder, exist_ok=True)
-    
-    for url in url_list:
-        download_image(url, folder)
+
+    # One keep-alive session, manifest and blob store for the whole run
+    manifest = DownloadManifest(os.path.join(folder, "manifest.sqlite"))
+    store = BlobStore(folder)
+    with requests.Session() as session:
+        for url in url_list:
+            if not isinstance(url, str) or not url.strip():  # Blank CSV cells
+                continue
+            download_image(url.strip(), folder, session, manifest, store)
+    # url_index.tsv maps every URL to the content hash and file it resolved to
+    store.write_index(manifest)
+    manifest.close()
 
 
 if __name__ == "__main__":
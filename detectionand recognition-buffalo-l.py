@@ -1,9 +1,13 @@
 import os
-import cv2
+import csv
+import hashlib
+import sqlite3
 import numpy as np
 import faiss
 from insightface.app import FaceAnalysis
-from scipy.spatial.distance import cosine
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+from face_pipeline import ImagePipeline
 
 # Initialize the FaceAnalysis application with buffalo_l model
 app = FaceAnalysis(name='buffalo_l')
@@ -13,65 +17,311 @@ def get_face_data(image):
     faces = app.get(image)
     return [(face.embedding, face.bbox) for face in faces]
 
-# Function to compare two face embeddings
-def compare_faces(emb1, emb2, threshold=0.24):
-    similarity = 1 - cosine(emb1, emb2)
-    return similarity > threshold
+# Above this many unique faces, exact search is swapped for an HNSW graph
+HNSW_THRESHOLD = 20000
 
-# Process all images in a folder
-def process_image_folder(input_folder, output_folder, threshold=0.24, det_thresh=0.8):
+# Normalize embeddings so inner product equals cosine similarity
+def normalize_embeddings(embeddings):
+    embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, 512)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+# Inner-product index over normalized embeddings: exact flat, or HNSW when large
+def make_index(dim, size=0):
+    if size > HNSW_THRESHOLD:
+        index = faiss.IndexHNSWFlat(dim, 32, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efSearch = 64
+        return index
+    return faiss.IndexFlatIP(dim)
+
+# Switch a growing flat index to HNSW once it crosses HNSW_THRESHOLD.
+# load_embeddings() returns every embedding in the index; it is only called
+# when upgrading, so the full array isn't rebuilt on each add
+def maybe_upgrade_index(index, load_embeddings):
+    if isinstance(index, faiss.IndexFlatIP) and index.ntotal > HNSW_THRESHOLD:
+        upgraded = make_index(index.d, index.ntotal)
+        upgraded.add(load_embeddings())
+        return upgraded
+    return index
+
+# Find which of a batch of normalized embeddings are unique, in order.
+# A face is a duplicate if its cosine similarity to any face kept before it
+# (already in the index, or earlier in this batch) is above threshold.
+def find_unique(embeddings, index, threshold):
+    is_unique = np.ones(len(embeddings), dtype=bool)
+    if index.ntotal > 0:
+        similarities, _ = index.search(embeddings, 1)
+        is_unique &= similarities[:, 0] <= threshold
+    # Faces in the same batch can also match each other
+    candidates = np.flatnonzero(is_unique)
+    batch_similarities = embeddings[candidates] @ embeddings[candidates].T
+    kept = []
+    for i, candidate in enumerate(candidates):
+        if kept and np.any(batch_similarities[i, kept] > threshold):
+            is_unique[candidate] = False
+        else:
+            kept.append(i)
+    return is_unique
+
+# On-disk face gallery that survives between runs:
+#   index.faiss     - FAISS index over normalized embeddings
+#   embeddings.f32  - raw float32 embeddings, row i is face id i (memory-mapped)
+#   metadata.sqlite - faces(id, image_path, bbox, crop_path) and the files already processed
+class FaceGallery:
+    def __init__(self, gallery_dir, dim=512, fingerprint="mtime"):
+        # fingerprint "mtime" keys processed files by path+mtime+size, "hash" by content sha1
+        assert fingerprint in ("mtime", "hash")
+        self.gallery_dir = gallery_dir
+        self.dim = dim
+        self.fingerprint = fingerprint
+        os.makedirs(gallery_dir, exist_ok=True)
+        self.index_path = os.path.join(gallery_dir, "index.faiss")
+        self.embeddings_path = os.path.join(gallery_dir, "embeddings.f32")
+        self.db = sqlite3.connect(os.path.join(gallery_dir, "metadata.sqlite"))
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS faces (
+                id INTEGER PRIMARY KEY, image_path TEXT,
+                x1 REAL, y1 REAL, x2 REAL, y2 REAL, crop_path TEXT);
+            CREATE TABLE IF NOT EXISTS processed_files (
+                fingerprint TEXT PRIMARY KEY, image_path TEXT);
+        """)
+        self.size = self.db.execute("SELECT COUNT(*) FROM faces").fetchone()[0]
+
+        # Drop embeddings written by a run that crashed before committing metadata
+        if not os.path.exists(self.embeddings_path):
+            open(self.embeddings_path, "wb").close()
+        if os.path.getsize(self.embeddings_path) != self.size * dim * 4:
+            with open(self.embeddings_path, "r+b") as f:
+                f.truncate(self.size * dim * 4)
+
+        self.index = None
+        if os.path.exists(self.index_path):
+            self.index = faiss.read_index(self.index_path)
+        if self.index is None or self.index.ntotal != self.size:
+            self.index = make_index(dim, self.size)
+            if self.size:
+                self.index.add(np.ascontiguousarray(self.embeddings))
+
+    @property
+    def embeddings(self):
+        if self.size == 0:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.memmap(self.embeddings_path, dtype=np.float32, mode="r", shape=(self.size, self.dim))
+
+    def file_key(self, image_path):
+        if self.fingerprint == "hash":
+            with open(image_path, "rb") as f:
+                return hashlib.sha1(f.read()).hexdigest()
+        stat = os.stat(image_path)
+        return f"{os.path.abspath(image_path)}:{stat.st_mtime_ns}:{stat.st_size}"
+
+    def is_processed(self, file_key):
+        row = self.db.execute("SELECT 1 FROM processed_files WHERE fingerprint = ?", (file_key,)).fetchone()
+        return row is not None
+
+    # Append unique faces and mark their source files done in one transaction
+    def add(self, embeddings, records, processed_files):
+        ids = list(range(self.size, self.size + len(embeddings)))
+        with open(self.embeddings_path, "ab") as f:
+            f.write(np.ascontiguousarray(embeddings, dtype=np.float32).tobytes())
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO faces (id, image_path, x1, y1, x2, y2, crop_path) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(face_id, image_path, *map(float, bbox[:4]), crop_path)
+                 for face_id, (image_path, bbox, crop_path) in zip(ids, records)],
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO processed_files (fingerprint, image_path) VALUES (?, ?)",
+                processed_files,
+            )
+        self.index.add(embeddings)
+        self.size += len(embeddings)
+        self.index = maybe_upgrade_index(self.index, lambda: np.ascontiguousarray(self.embeddings))
+        return ids
+
+    def save(self):
+        faiss.write_index(self.index, self.index_path)
+
+    def close(self):
+        self.save()
+        self.db.close()
+
+# Process all images in a folder. With gallery_dir, unique faces are kept on
+# disk across runs and files processed by an earlier run are skipped.
+def process_image_folder(input_folder, output_folder, threshold=0.24, det_thresh=0.8, batch_size=256,
+                         gallery_dir=None, fingerprint="mtime", io_workers=4, queue_size=32):
     # Prepare the model with the detection threshold
     app.prepare(ctx_id=-1, det_size=(640, 640), det_thresh=det_thresh)
 
     dim = 512  # Dimension of face embeddings
-    index = faiss.IndexFlatL2(dim)
-    
-    unique_faces = []
-    unique_face_images = []
+    gallery = FaceGallery(gallery_dir, dim, fingerprint) if gallery_dir else None
+    index = gallery.index if gallery else make_index(dim)
+    unique_embeddings = []
+    num_unique = gallery.size if gallery else 0
+    os.makedirs(output_folder, exist_ok=True)
+    # Reads and crop writes run on a thread pool, the model on this thread
+    pipeline = ImagePipeline(io_workers, queue_size)
+
+    # Faces waiting for the next batched index search
+    pending_embeddings = []
+    pending_faces = []  # (image_path, bbox, face_image)
+    pending_files = []  # (file_key, image_path) fully queued since the last flush
+
+    def flush():
+        nonlocal index, num_unique
+        if pending_embeddings:
+            embeddings = normalize_embeddings(pending_embeddings)
+            is_unique = find_unique(embeddings, index, threshold)
+            new_embeddings = embeddings[is_unique]
+        else:
+            is_unique = np.zeros(0, dtype=bool)
+            new_embeddings = np.zeros((0, dim), dtype=np.float32)
+
+        # Save unique faces
+        records = []
+        for (image_path, bbox, face_image), keep in zip(pending_faces, is_unique):
+            if not keep:
+                continue
+            output_path = os.path.join(output_folder, f"unique_face_{num_unique + len(records)}.jpg")
+            if face_image.size != 0:  # Check if the image is not empty
+                pipeline.write(output_path, face_image)
+            records.append((image_path, bbox, output_path))
 
+        if gallery:
+            gallery.add(new_embeddings, records, pending_files)
+            index = gallery.index
+        else:
+            index.add(new_embeddings)
+            unique_embeddings.append(new_embeddings)
+            index = maybe_upgrade_index(index, lambda: np.vstack(unique_embeddings))
+        num_unique += len(records)
+        pending_embeddings.clear()
+        pending_faces.clear()
+        pending_files.clear()
+
+    skipped = 0
+    image_paths = []
+    file_keys = {}
     for filename in os.listdir(input_folder):
         if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
             image_path = os.path.join(input_folder, filename)
-            image = cv2.imread(image_path)
+            if gallery:
+                file_key = gallery.file_key(image_path)
+                if gallery.is_processed(file_key):
+                    skipped += 1
+                    continue
+                file_keys[image_path] = file_key
+            image_paths.append(image_path)
+
+    for image_path, image in pipeline.decode(image_paths):
+        if image is None:
+            print(f"Failed to load image: {image_path}")
+            continue
+
+        face_data = pipeline.infer(get_face_data, image)
+
+        for embedding, bbox in face_data:
+            pending_embeddings.append(embedding)
+            face_image = image[int(bbox[1]):int(bbox[3]), int(bbox[0]):int(bbox[2])]
+            pending_faces.append((image_path, bbox, face_image))
+        if gallery:
+            pending_files.append((file_keys[image_path], image_path))
+
+        if len(pending_embeddings) >= batch_size:
+            flush()
+    flush()
+    pipeline.close()
+
+    if gallery:
+        gallery.close()
+        print(f"Skipped {skipped} already processed images")
+
+    return num_unique
+
+# Cluster every face in a folder instead of greedy first-match dedup.
+# All embeddings go into one matrix, a k-NN graph is built with batched FAISS
+# searches, and connected components of the edges with similarity above
+# threshold become clusters. The result does not depend on file order.
+def cluster_image_folder(input_folder, output_folder, threshold=0.24, det_thresh=0.8, k=10,
+                         search_batch=4096, io_workers=4, queue_size=32):
+    app.prepare(ctx_id=-1, det_size=(640, 640), det_thresh=det_thresh)
+    os.makedirs(output_folder, exist_ok=True)
+
+    embeddings = []
+    records = []  # (image_path, bbox, det_score)
+    image_paths = [os.path.join(input_folder, filename) for filename in os.listdir(input_folder)
+                   if filename.lower().endswith(('.png', '.jpg', '.jpeg'))]
+    with ImagePipeline(io_workers, queue_size) as pipeline:
+        for image_path, image in pipeline.decode(image_paths):
             if image is None:
                 print(f"Failed to load image: {image_path}")
                 continue
+            for face in pipeline.infer(app.get, image):
+                embeddings.append(face.embedding)
+                records.append((image_path, face.bbox, float(face.det_score)))
 
-            face_data = get_face_data(image)
-            
-            for embedding, bbox in face_data:
-                if index.ntotal == 0:
-                    index.add(np.array([embedding]))
-                    unique_faces.append(embedding)
-                    face_image = image[int(bbox[1]):int(bbox[3]), int(bbox[0]):int(bbox[2])]
-                    unique_face_images.append(face_image)
-                else:
-                    is_unique = True
-                    for unique_emb in unique_faces:
-                        if compare_faces(embedding, unique_emb, threshold):
-                            is_unique = False
-                            break
-                    if is_unique:
-                        index.add(np.array([embedding]))
-                        unique_faces.append(embedding)
-                        face_image = image[int(bbox[1]):int(bbox[3]), int(bbox[0]):int(bbox[2])]
-                        unique_face_images.append(face_image)
-
-    # Save unique faces
-    os.makedirs(output_folder, exist_ok=True)
-    for i, face_image in enumerate(unique_face_images):
-        if face_image.size != 0:  # Check if the image is not empty
-            output_path = os.path.join(output_folder, f"unique_face_{i}.jpg")
-            cv2.imwrite(output_path, face_image)
+    num_faces = len(records)
+    if num_faces == 0:
+        return 0
+    embeddings = normalize_embeddings(embeddings)
 
-    return len(unique_faces)
+    # k-NN graph: each face links to its neighbours above the threshold
+    index = make_index(embeddings.shape[1], num_faces)
+    index.add(embeddings)
+    k = min(k + 1, num_faces)  # +1 because every face finds itself
+    rows, cols = [], []
+    for start in range(0, num_faces, search_batch):
+        similarities, neighbours = index.search(embeddings[start:start + search_batch], k)
+        mask = (similarities > threshold) & (neighbours >= 0)
+        rows.append(np.nonzero(mask)[0] + start)
+        cols.append(neighbours[mask])
+    rows = np.concatenate(rows)
+    cols = np.concatenate(cols)
+    graph = csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(num_faces, num_faces))
+    num_clusters, labels = connected_components(graph, directed=False)
+
+    # Representative crop per cluster: the face with the highest detection score
+    scores = np.array([det_score for _, _, det_score in records])
+    best = {}
+    for face_id in np.argsort(-scores, kind="stable"):
+        best.setdefault(labels[face_id], face_id)
+    with ImagePipeline(io_workers, queue_size) as pipeline:
+        by_image = {}
+        for cluster_id, face_id in best.items():
+            by_image.setdefault(records[face_id][0], []).append((cluster_id, face_id))
+        for image_path, image in pipeline.decode(list(by_image)):
+            if image is None:
+                continue
+            for cluster_id, face_id in by_image[image_path]:
+                bbox = records[face_id][1]
+                face_image = image[max(int(bbox[1]), 0):int(bbox[3]), max(int(bbox[0]), 0):int(bbox[2])]
+                if face_image.size != 0:
+                    pipeline.write(os.path.join(output_folder, f"cluster_{cluster_id}.jpg"), face_image)
+
+    with open(os.path.join(output_folder, "clusters.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["image_path", "x1", "y1", "x2", "y2", "det_score", "cluster_id", "representative"])
+        for face_id, (image_path, bbox, det_score) in enumerate(records):
+            writer.writerow([image_path, *[round(float(v), 1) for v in bbox[:4]], round(det_score, 4),
+                             int(labels[face_id]), int(best[labels[face_id]] == face_id)])
+
+    return num_clusters
 
 # Specify the input and output folder paths
 input_folder = '/home/narravenkataraghucharan/Desktop/shuttleresults/1Images_1712293658275 (1)'
 output_folder = 'output'
+gallery_dir = 'face_gallery'  # Reruns only embed images added since the last run
+
+mode = 'dedup'  # 'dedup' keeps the first match per face, 'cluster' groups all faces at once
 
-# Process the folder and get the number of unique faces
-num_unique_faces = process_image_folder(input_folder, output_folder, threshold=0.3, det_thresh=0.8)
+if mode == 'cluster':
+    num_clusters = cluster_image_folder(input_folder, output_folder, threshold=0.3, det_thresh=0.8)
+    print(f"Number of face clusters found: {num_clusters}")
+    print(f"Cluster representatives and clusters.csv saved in: {output_folder}")
+else:
+    # Process the folder and get the number of unique faces
+    num_unique_faces = process_image_folder(input_folder, output_folder, threshold=0.3, det_thresh=0.8,
+                                            gallery_dir=gallery_dir)
 
-print(f"Number of unique faces found: {num_unique_faces}")
-print(f"Unique faces saved in: {output_folder}")
+    print(f"Number of unique faces found: {num_unique_faces}")
+    print(f"Unique faces saved in: {output_folder}")
@@ -0,0 +1,209 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp")
+
+
+def url_filename(url):
+    """Collision-free file name: a hash of the full URL plus its image extension."""
+    extension = os.path.splitext(urlsplit(url).path)[1].lower()
+    if extension not in IMAGE_EXTENSIONS:
+        extension = ".jpg"
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()[:20] + extension
+
+
+class DownloadManifest:
+    """Durable record of every URL fetched, so a rerun picks up where it stopped.
+
+    Keyed by URL with status ("partial", "done" or "failed"), content
+    sha256, final path, ETag, Last-Modified and size. SQLite commits per
+    call, so a crash loses at most the download in progress. That file
+    is kept as <path>.part and resumed with an HTTP Range request.
+    Safe to share between threads.
+    """
+
+    def __init__(self, db_path):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        with self.db:
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS downloads (
+                    url TEXT PRIMARY KEY, status TEXT, content_hash TEXT, path TEXT,
+                    etag TEXT, last_modified TEXT, bytes INTEGER, error TEXT, updated_at REAL)
+            """)
+
+    def get(self, url):
+        with self.lock:
+            cursor = self.db.execute("SELECT * FROM downloads WHERE url = ?", (url,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return dict(zip([column[0] for column in cursor.description], row))
+
+    def _upsert(self, url, **fields):
+        fields["updated_at"] = time.time()
+        columns = ", ".join(fields)
+        placeholders = ", ".join("?" for _ in fields)
+        updates = ", ".join(f"{column} = excluded.{column}" for column in fields)
+        with self.lock, self.db:
+            self.db.execute(
+                f"INSERT INTO downloads (url, {columns}) VALUES (?, {placeholders}) "
+                f"ON CONFLICT(url) DO UPDATE SET {updates}",
+                (url, *fields.values()),
+            )
+
+    def plan(self, url, folder, max_age=None):
+        """Decide how to fetch a URL.
+
+        Returns a dict with "skip" (already complete and fresh), "path",
+        "part_path", request "headers" and "resume_from" (bytes already on
+        disk). Completed entries older than max_age seconds are revalidated
+        with If-None-Match / If-Modified-Since instead of being skipped.
+        """
+        entry = self.get(url)
+        # The partial file is always named after the URL, so URLs that share a
+        # content-addressed blob never write to the same .part file
+        part_path = os.path.join(folder, url_filename(url)) + ".part"
+        if entry and entry["status"] == "done" and entry["path"] and os.path.exists(entry["path"]):
+            path = entry["path"]
+        else:
+            path = part_path[:-len(".part")]
+        plan = {"skip": False, "path": path, "part_path": part_path, "headers": {}, "resume_from": 0}
+
+        if entry and entry["status"] == "done" and os.path.exists(path):
+            if max_age is None or time.time() - entry["updated_at"] < max_age:
+                plan["skip"] = True
+                return plan
+            if entry["etag"]:
+                plan["headers"]["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                plan["headers"]["If-Modified-Since"] = entry["last_modified"]
+            return plan
+
+        if os.path.exists(plan["part_path"]):
+            plan["resume_from"] = os.path.getsize(plan["part_path"])
+            plan["headers"]["Range"] = f"bytes={plan['resume_from']}-"
+            # If-Range makes the server send the whole file if it changed meanwhile
+            validator = (entry or {}).get("etag") or (entry or {}).get("last_modified")
+            if validator:
+                plan["headers"]["If-Range"] = validator
+        return plan
+
+    def completed(self):
+        """(url, content_hash, path) for every finished download."""
+        with self.lock:
+            return self.db.execute(
+                "SELECT url, content_hash, path FROM downloads WHERE status = 'done' ORDER BY url"
+            ).fetchall()
+
+    def mark_partial(self, url, path, etag=None, last_modified=None):
+        self._upsert(url, status="partial", path=path, etag=etag, last_modified=last_modified, error=None)
+
+    def mark_done(self, url, path, content_hash, etag=None, last_modified=None, size=None):
+        self._upsert(url, status="done", path=path, content_hash=content_hash, etag=etag,
+                     last_modified=last_modified, bytes=size, error=None)
+
+    def mark_not_modified(self, url):
+        self._upsert(url, status="done")
+
+    def mark_failed(self, url, error):
+        self._upsert(url, status="failed", error=str(error))
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def hash_file(path, hasher=None, chunk_size=1 << 20):
+    hasher = hasher or hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher
+
+
+def part_is_complete(response_headers, resume_from):
+    """True if a 416 reply's Content-Range ("bytes */<total>") matches the .part size.
+
+    That means the previous run got every byte but stopped before
+    committing, so resuming has nothing left to ask for.
+    """
+    content_range = response_headers.get("Content-Range", "")
+    return content_range.startswith("bytes */") and content_range[len("bytes */"):].strip() == str(resume_from)
+
+
+def restart_plan(plan):
+    """The same plan without the Range request, for refetching from byte 0."""
+    headers = {k: v for k, v in plan["headers"].items() if k not in ("Range", "If-Range")}
+    return dict(plan, headers=headers, resume_from=0)
+
+
+def download_with_manifest(
+    session, url, folder, manifest, timeout=10, max_age=None, chunk_size=8192, store=None
+):
+    """Fetch one URL with requests, resuming or revalidating from the manifest.
+
+    With a blob_store.BlobStore the finished file is stored by content
+    hash, so the same image behind several URLs is kept once. Returns
+    "skipped", "not_modified" or "downloaded"; raises
+    requests.exceptions.RequestException on failure after recording it.
+    """
+    plan = manifest.plan(url, folder, max_age)
+    if plan["skip"]:
+        return "skipped"
+    try:
+        response = session.get(url, headers=plan["headers"], stream=True, timeout=timeout)
+        if response.status_code == 416 and plan["resume_from"]:
+            response.close()
+            if part_is_complete(response.headers, plan["resume_from"]):
+                # The last run got every byte but stopped before committing
+                hasher = hash_file(plan["part_path"])
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+                return _commit_part(url, plan, manifest, store, hasher, etag, last_modified)
+            # The file is now shorter than the .part, so start over
+            os.remove(plan["part_path"])
+            plan = restart_plan(plan)
+            response = session.get(url, headers=plan["headers"], stream=True, timeout=timeout)
+        with response:
+            if response.status_code == 304:
+                manifest.mark_not_modified(url)
+                return "not_modified"
+            response.raise_for_status()
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+
+            # 206 continues the partial file, anything else starts over
+            if response.status_code == 206 and plan["resume_from"]:
+                hasher = hash_file(plan["part_path"])
+                mode = "ab"
+            else:
+                hasher = hashlib.sha256()
+                mode = "wb"
+            manifest.mark_partial(url, plan["path"], etag, last_modified)
+            with open(plan["part_path"], mode) as file:
+                for chunk in response.iter_content(chunk_size):
+                    hasher.update(chunk)
+                    file.write(chunk)
+        return _commit_part(url, plan, manifest, store, hasher, etag, last_modified)
+    except requests.exceptions.RequestException as e:
+        manifest.mark_failed(url, e)
+        raise
+
+
+def _commit_part(url, plan, manifest, store, hasher, etag, last_modified):
+    size = os.path.getsize(plan["part_path"])
+    content_hash = hasher.hexdigest()
+    if store is not None:
+        path = store.commit(plan["part_path"], content_hash)
+    else:
+        path = plan["path"]
+        os.replace(plan["part_path"], path)
+    manifest.mark_done(url, path, content_hash, etag, last_modified, size)
+    return "downloaded"
@@ -0,0 +1,86 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+
+# Staged read -> infer -> write pipeline for folder face processing.
+# cv2.imread and cv2.imwrite run on a thread pool (OpenCV releases the GIL
+# while decoding/encoding). infer() runs the model on whichever thread calls
+# it: the caller's own thread, or several detector threads, in which case the
+# caller must give each thread its own model or serialize access to a shared one.
+class ImagePipeline:
+    def __init__(self, io_workers=4, queue_size=32):
+        self.executor = ThreadPoolExecutor(max_workers=io_workers)
+        # Max decoded images waiting for the model at once
+        self.queue_size = queue_size
+        self.stats = {stage: {"items": 0, "seconds": 0.0} for stage in ("decode", "infer", "write")}
+        self.depth_samples = []
+        self.write_futures = deque()
+        self.lock = threading.Lock()
+        self.start_time = time.perf_counter()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _timed(self, stage, fn, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.stats[stage]["items"] += 1
+                self.stats[stage]["seconds"] += elapsed
+
+    def decode(self, image_paths):
+        """Yield (path, image) in input order, reading ahead on the thread pool."""
+        pending = deque()
+
+        def pop():
+            # Depth = images already decoded and waiting for the model
+            self.depth_samples.append(sum(future.done() for _, future in pending))
+            path, future = pending.popleft()
+            return path, future.result()
+
+        for path in image_paths:
+            pending.append((path, self.executor.submit(self._timed, "decode", cv2.imread, path)))
+            if len(pending) >= self.queue_size:
+                yield pop()
+        while pending:
+            yield pop()
+
+    def infer(self, fn, *args, **kwargs):
+        """Run a model call on the calling thread, counted as the infer stage."""
+        return self._timed("infer", fn, *args, **kwargs)
+
+    def write(self, output_path, image):
+        """Encode and write an image in the background."""
+        # The future keeps the crop (often a view into the frame) alive until written
+        future = self.executor.submit(self._timed, "write", cv2.imwrite, output_path, image)
+        with self.lock:
+            self.write_futures.append(future)
+            while self.write_futures and self.write_futures[0].done():
+                self.write_futures.popleft().result()
+
+    def close(self):
+        while self.write_futures:
+            self.write_futures.popleft().result()
+        self.executor.shutdown(wait=True)
+        self.report()
+
+    def report(self):
+        wall = time.perf_counter() - self.start_time
+        print(f"Pipeline finished in {wall:.1f}s")
+        for stage, stat in self.stats.items():
+            # Per-stage throughput while busy, so a slow stage stands out
+            rate = stat["items"] / stat["seconds"] if stat["seconds"] > 0 else 0.0
+            print(f"  {stage:<7} {stat['items']:>7} items  {stat['seconds']:8.1f}s busy  {rate:8.1f} items/s")
+        if self.depth_samples:
+            mean_depth = sum(self.depth_samples) / len(self.depth_samples)
+            print(f"  queue depth mean {mean_depth:.1f}, max {max(self.depth_samples)} of {self.queue_size}")
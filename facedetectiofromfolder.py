@@ -1,38 +1,106 @@
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from retinaface import RetinaFace
-import cv2
+from face_pipeline import ImagePipeline
 
-def generate_faces(input_folder, output_folder):
+try:
+    from SCRFD_class import SCRFD
+except ImportError:
+    SCRFD = None
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.webp')
+
+# SCRFD is much cheaper than RetinaFace on CPU, use it when the model is around
+SCRFD_MODEL = "models/scrfd.onnx"
+
+def make_detector(backend="auto", scrfd_model=SCRFD_MODEL, thresh=0.5, input_size=(640, 640), workers=1):
+    # Returns detect(image) -> list of (x1, y1, x2, y2) for a decoded BGR image,
+    # safe to call from `workers` threads at once
+    if backend == "auto":
+        backend = "scrfd" if SCRFD is not None and os.path.exists(scrfd_model) else "retinaface"
+
+    if backend == "scrfd":
+        # One SCRFD per worker thread, since it reuses preprocessing buffers.
+        # The cores are split between the sessions instead of each starting
+        # one spinning intra-op thread per core
+        local = threading.local()
+        threads_per_session = max(1, (os.cpu_count() or 1) // workers)
+
+        def detect(image):
+            if not hasattr(local, "detector"):
+                local.detector = SCRFD(scrfd_model, intra_op_num_threads=threads_per_session, allow_spinning=False)
+            bboxes, _ = local.detector.detect(image, thresh=thresh, input_size=input_size)
+            return [tuple(max(int(v), 0) for v in bbox[:4]) for bbox in bboxes]
+        return backend, detect
+
+    # RetinaFace keeps one global model, so detections take turns
+    lock = threading.Lock()
+
+    def detect(image):
+        # Pass the decoded array so RetinaFace doesn't read the file again
+        with lock:
+            faces = RetinaFace.detect_faces(image)
+        if not isinstance(faces, dict):  # No faces found
+            return []
+        return [tuple(face['facial_area']) for face in faces.values()]
+    return backend, detect
+
+def generate_faces(input_folder, output_folder, workers=2, io_workers=4, queue_size=32,
+                   backend="auto", scrfd_model=SCRFD_MODEL, skip_existing=True, det_thresh=0.5):
     # Create the output folder if it doesn't exist
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
-    # Iterate through each image in the input folder
-    for filename in os.listdir(input_folder):
-        # Construct the path to the input image
-        input_image_path = os.path.join(input_folder, filename)
+    # Images that already have crops from an earlier run are skipped
+    done_stems = set()
+    if skip_existing:
+        done_stems = {name.rsplit("_face_", 1)[0] for name in os.listdir(output_folder) if "_face_" in name}
 
-        # Load the input image
-        image = cv2.imread(input_image_path)
+    # Construct the path to each input image, ignoring non-image files
+    image_paths = [
+        os.path.join(input_folder, filename)
+        for filename in os.listdir(input_folder)
+        if filename.lower().endswith(IMAGE_EXTENSIONS) and os.path.splitext(filename)[0] not in done_stems
+    ]
 
-        # Detect faces in the image using RetinaFace
-        faces = RetinaFace.detect_faces(input_image_path)
-
-        # Extract and save each detected face
-        for i, face in faces.items():
-            # Extract the coordinates of the face bounding box
-            x1, y1, x2, y2 = face['facial_area']
+    backend, detect = make_detector(backend, scrfd_model, det_thresh, workers=workers)
+    if backend == "retinaface":
+        # Its detections are serialized anyway; more threads would only wait
+        workers = 1
+    print(f"Detecting faces in {len(image_paths)} images with {backend}")
 
+    def process(pipeline, input_image_path, image):
+        filename = os.path.basename(input_image_path)
+        for i, (x1, y1, x2, y2) in enumerate(pipeline.infer(detect, image), start=1):
             # Crop the face region from the image
             face_image = image[y1:y2, x1:x2]
+            if face_image.size == 0:
+                continue
 
             # Construct the path to save the face image
             output_face_path = os.path.join(output_folder, f"{os.path.splitext(filename)[0]}_face_{i}.jpg")
 
-            # Save the face image
-            cv2.imwrite(output_face_path, face_image)
+            # Save the face image in the background
+            pipeline.write(output_face_path, face_image)
+
+            print(f"Face {i} from {filename} saved as {output_face_path}")
 
-            print(f"Face {i+1} from {filename} saved as {output_face_path}")
+    # Each image is decoded once on the I/O pool, then detected on one of
+    # `workers` threads; in-flight images are bounded by queue_size
+    slots = threading.BoundedSemaphore(queue_size)
+    with ImagePipeline(io_workers, queue_size) as pipeline, ThreadPoolExecutor(max_workers=workers) as detectors:
+        futures = []
+        for input_image_path, image in pipeline.decode(image_paths):
+            if image is None:
+                print(f"Failed to load image: {input_image_path}")
+                continue
+            slots.acquire()
+            future = detectors.submit(process, pipeline, input_image_path, image)
+            future.add_done_callback(lambda _: slots.release())
+            futures.append(future)
+        for future in futures:
+            future.result()
 
 # Example usage
 input_folder = "/path/to/input/folder"
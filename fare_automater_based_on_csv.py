@@ -1,18 +1,27 @@
-import csv
 from datetime import datetime
 from clickhouse_driver import Client
 import psycopg2
+from fare_index import FareIndex
+
+# Opened on first use and shared by every call; rebuilt only when output.csv changes
+_fare_index = None
+
+def get_fare_index():
+    global _fare_index
+    if _fare_index is None:
+        _fare_index = FareIndex('output.csv')
+    return _fare_index
 
 def update_trip_seats_fares(service_key, trip_id):
     # ClickHouse Configuration
     CLICKHOUSE_HOST = "HOST_ADDRESS"
     CLICKHOUSE_PORT = 9000
     CLICKHOUSE_USER = "freshbus"
-    CLICKHOUSE_PASSWORD = "PASSWORD
+    CLICKHOUSE_PASSWORD = "PASSWORD"
     CLICKHOUSE_DATABASE = "freshbus_operations"
 
     # PostgreSQL Configuration
-    POSTGRES_HOST = "HOST_URL
+    POSTGRES_HOST = "HOST_URL"
     POSTGRES_PORT = 5432
     POSTGRES_USER = "postgres"
     POSTGRES_PASSWORD = "PASSWORD"
@@ -45,13 +54,13 @@ def update_trip_seats_fares(service_key, trip_id):
     
     route, classification_label = result[0]
     
-    # Step 2: Read the output.csv file
+    # Step 2: Look up the seat fares in the index built from output.csv
     fares_data = {}
-    with open('output.csv', 'r') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            if row['route'] == route and row['classification'] == str(classification_label):
-                fares_data[int(row['seatid'])] = float(row['base_fare'])
+    seat_fares = get_fare_index().lookup(route, classification_label)
+    if seat_fares is not None:
+        seat_ids, fares = seat_fares
+        # tolist() gives plain ints/floats, which psycopg2 can adapt
+        fares_data = dict(zip(seat_ids.tolist(), fares.tolist()))
     
     if not fares_data:
         print(f"No matching fare data found for route {route} and classification {classification_label}")
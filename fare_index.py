@@ -0,0 +1,106 @@
+import os
+import sqlite3
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Let SQLite read the index through mmap instead of copying pages into its cache
+MMAP_SIZE = 1 << 30
+
+
+def index_path_for(csv_path):
+    return os.path.splitext(csv_path)[0] + ".fareidx.sqlite"
+
+
+def _source_signature(csv_path):
+    stat = os.stat(csv_path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def build_fare_index(csv_path="output.csv", index_path=None, chunksize=500_000):
+    # One row per (route, classification) holding packed int32 seat ids and
+    # float64 fares, built in a single chunked pass over the expander output.
+    # Written to a temp file and renamed, so readers never see a partial index
+    index_path = index_path or index_path_for(csv_path)
+    size, mtime_ns = _source_signature(csv_path)
+    frames = []
+    for chunk in pd.read_csv(csv_path, usecols=["route", "classification", "base_fare", "seatid"],
+                             dtype={"route": str, "classification": str}, keep_default_na=False,
+                             chunksize=chunksize):
+        seats = pd.to_numeric(chunk["seatid"], errors="coerce")
+        fares = pd.to_numeric(chunk["base_fare"], errors="coerce")
+        # Rows whose seat bucket wasn't expanded have no numeric seat id
+        valid = (seats.notna() & fares.notna()).to_numpy()
+        frames.append(pd.DataFrame({
+            "route": chunk["route"].to_numpy()[valid],
+            "classification": chunk["classification"].to_numpy()[valid],
+            "seat": seats.to_numpy()[valid].astype(np.int32),
+            "fare": fares.to_numpy()[valid].astype(np.float64),
+        }))
+    table = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(
+        {"route": [], "classification": [], "seat": np.array([], np.int32), "fare": np.array([], np.float64)})
+    # A seat listed twice keeps its last fare, as the old dict-based scan did
+    table = table.drop_duplicates(["route", "classification", "seat"], keep="last")
+    seats = table["seat"].to_numpy(np.int32)
+    fares = table["fare"].to_numpy(np.float64)
+    groups = table.groupby(["route", "classification"], sort=False).indices
+
+    temp_path = index_path + ".tmp"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    db = sqlite3.connect(temp_path)
+    with db:
+        db.execute("CREATE TABLE fares (route TEXT, classification TEXT, seats BLOB, fares BLOB, "
+                   "PRIMARY KEY (route, classification)) WITHOUT ROWID")
+        db.execute("CREATE TABLE source (path TEXT, size INTEGER, mtime_ns INTEGER)")
+        db.execute("INSERT INTO source VALUES (?, ?, ?)", (os.path.abspath(csv_path), size, mtime_ns))
+        db.executemany("INSERT INTO fares VALUES (?, ?, ?, ?)", (
+            (route, classification, seats[positions].tobytes(), fares[positions].tobytes())
+            for (route, classification), positions in groups.items()
+        ))
+    db.close()
+    os.replace(temp_path, index_path)
+    print(f"Built fare index {index_path}: {len(groups)} route/classification pairs")
+    return index_path
+
+
+class FareIndex:
+    # Read side of the index. Opening it checks the CSV's size and mtime
+    # against the ones recorded at build time and rebuilds only on a mismatch
+    def __init__(self, csv_path="output.csv", index_path=None):
+        self.csv_path = csv_path
+        self.index_path = index_path or index_path_for(csv_path)
+        if not self._is_current():
+            build_fare_index(csv_path, self.index_path)
+        self.db = sqlite3.connect(f"file:{self.index_path}?mode=ro", uri=True, check_same_thread=False)
+        self.db.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+
+    def _is_current(self):
+        if not os.path.exists(self.index_path):
+            return False
+        try:
+            db = sqlite3.connect(f"file:{self.index_path}?mode=ro", uri=True)
+            try:
+                recorded = db.execute("SELECT size, mtime_ns FROM source").fetchone()
+            finally:
+                db.close()
+        except sqlite3.DatabaseError:
+            return False
+        return recorded == _source_signature(self.csv_path)
+
+    def lookup(self, route, classification):
+        # Returns (seat ids, fares) as numpy arrays, or None if the pair isn't in the CSV
+        row = self.db.execute(
+            "SELECT seats, fares FROM fares WHERE route = ? AND classification = ?", (route, str(classification))
+        ).fetchone()
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=np.int32), np.frombuffer(row[1], dtype=np.float64)
+
+    def close(self):
+        self.db.close()
+
+
+if __name__ == "__main__":
+    build_fare_index(sys.argv[1] if len(sys.argv) > 1 else "output.csv")
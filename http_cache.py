@@ -0,0 +1,341 @@
+import asyncio
+import email.utils
+import hashlib
+import http.server
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# Without max-age or Expires, a response is fresh for 10% of its age since
+# Last-Modified (the usual heuristic), capped at a day
+HEURISTIC_FRACTION = 0.1
+HEURISTIC_MAX_SECONDS = 24 * 3600
+
+
+def parse_cache_control(value):
+    directives = {}
+    for part in (value or "").split(","):
+        name, _, argument = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = argument.strip('"') or None
+    return directives
+
+
+def _http_date(value):
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def freshness_lifetime(headers, now=None):
+    """Seconds a response stays fresh, or None if it must not be stored."""
+    now = now or time.time()
+    directives = parse_cache_control(headers.get("Cache-Control"))
+    if "no-store" in directives:
+        return None
+    # Vary on anything but encoding would need per-request-header keys
+    vary = {v.strip().lower() for v in headers.get("Vary", "").split(",") if v.strip()}
+    if vary - {"accept-encoding"}:
+        return None
+    if "no-cache" in directives:
+        return 0
+    age = float(headers.get("Age", 0) or 0)
+    for name in ("s-maxage", "max-age"):
+        if (directives.get(name) or "").isdigit():
+            return max(0, int(directives[name]) - age)
+    expires = _http_date(headers.get("Expires"))
+    if expires is not None:
+        date = _http_date(headers.get("Date")) or now
+        return max(0, expires - date)
+    last_modified = _http_date(headers.get("Last-Modified"))
+    if last_modified is not None:
+        date = _http_date(headers.get("Date")) or now
+        return min(HEURISTIC_MAX_SECONDS, max(0, (date - last_modified) * HEURISTIC_FRACTION))
+    return 0
+
+
+class HTTPCache:
+    """On-disk HTTP response cache with LRU eviction, safe to share between threads.
+
+    Bodies are files under cache_dir named by URL hash; headers,
+    validators, expiry and last access live in cache_dir/index.sqlite.
+    Stale entries with an ETag or Last-Modified are revalidated with a
+    conditional request rather than refetched. Once bodies exceed
+    max_bytes, the least recently used entries are deleted.
+    """
+
+    def __init__(self, cache_dir="http_cache", max_bytes=1 << 30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(cache_dir, "index.sqlite"), check_same_thread=False)
+        with self.db:
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    url TEXT PRIMARY KEY, status INTEGER, headers TEXT, etag TEXT, last_modified TEXT,
+                    expires_at REAL, size INTEGER, last_access REAL)
+            """)
+            self.db.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_access)")
+        self.total_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0, "stored": 0, "evicted": 0, "bytes_served": 0}
+
+    def _body_path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha1(url.encode("utf-8")).hexdigest())
+
+    def lookup(self, url):
+        """Return the cached entry for url with its body, or None."""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT status, headers, etag, last_modified, expires_at FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            try:
+                with open(self._body_path(url), "rb") as f:
+                    body = f.read()
+            except FileNotFoundError:
+                return None
+            with self.db:
+                self.db.execute("UPDATE responses SET last_access = ? WHERE url = ?", (time.time(), url))
+        status, headers, etag, last_modified, expires_at = row
+        return {
+            "url": url, "status": status, "headers": json.loads(headers), "etag": etag,
+            "last_modified": last_modified, "expires_at": expires_at, "body": body,
+        }
+
+    @staticmethod
+    def is_fresh(entry):
+        return time.time() < entry["expires_at"]
+
+    @staticmethod
+    def conditional_headers(entry):
+        headers = {}
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(self, url, status, headers, body):
+        """Cache a 200 response if its headers allow it; returns True if stored."""
+        if status != 200:
+            return False
+        lifetime = freshness_lifetime(headers)
+        etag, last_modified = headers.get("ETag"), headers.get("Last-Modified")
+        # Nothing to gain from a response that is never fresh and can't be revalidated
+        if lifetime is None or (lifetime == 0 and not (etag or last_modified)):
+            return False
+        if len(body) > self.max_bytes:
+            return False
+
+        path = self._body_path(url)
+        now = time.time()
+        with self.lock:
+            with open(path + ".tmp", "wb") as f:
+                f.write(body)
+            os.replace(path + ".tmp", path)
+            old = self.db.execute("SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+            with self.db:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (url, status, json.dumps(dict(headers)), etag, last_modified, now + lifetime, len(body), now),
+                )
+            self.total_bytes += len(body) - (old[0] if old else 0)
+            self.stats["stored"] += 1
+            self._evict()
+        return True
+
+    def refresh(self, url, headers):
+        """Extend an entry after a 304, taking any updated validators and cache headers."""
+        with self.lock:
+            row = self.db.execute("SELECT headers FROM responses WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return
+            merged = CaseInsensitiveDict(json.loads(row[0]))
+            for name in ("Cache-Control", "Expires", "Date", "ETag", "Last-Modified", "Age"):
+                if name in headers:
+                    merged[name] = headers[name]
+            lifetime = freshness_lifetime(merged) or 0
+            with self.db:
+                self.db.execute(
+                    "UPDATE responses SET headers = ?, etag = ?, last_modified = ?, expires_at = ?, "
+                    "last_access = ? WHERE url = ?",
+                    (json.dumps(dict(merged)), merged.get("ETag"), merged.get("Last-Modified"),
+                     time.time() + lifetime, time.time(), url),
+                )
+
+    def _evict(self):
+        # Caller holds the lock
+        if self.total_bytes <= self.max_bytes:
+            return
+        rows = self.db.execute("SELECT url, size FROM responses ORDER BY last_access").fetchall()
+        evicted = []
+        for url, size in rows:
+            if self.total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(self._body_path(url))
+            except FileNotFoundError:
+                pass
+            self.total_bytes -= size
+            evicted.append((url,))
+        with self.db:
+            self.db.executemany("DELETE FROM responses WHERE url = ?", evicted)
+        self.stats["evicted"] += len(evicted)
+
+    def record(self, outcome, entry=None):
+        with self.lock:
+            self.stats[outcome] += 1
+            if entry is not None:
+                self.stats["bytes_served"] += len(entry["body"])
+
+    def report(self):
+        s = self.stats
+        lookups = s["hits"] + s["revalidated"] + s["misses"]
+        hit_rate = (s["hits"] + s["revalidated"]) / lookups if lookups else 0.0
+        print(
+            f"HTTP cache: {s['hits']} hits, {s['revalidated']} revalidated, {s['misses']} misses "
+            f"({hit_rate:.0%} served from cache, {s['bytes_served'] / 1e6:.1f} MB), "
+            f"{s['stored']} stored, {s['evicted']} evicted, {self.total_bytes / 1e6:.1f} MB on disk"
+        )
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def _cached_response(entry):
+    response = requests.models.Response()
+    response.status_code = entry["status"]
+    response.headers = CaseInsensitiveDict(entry["headers"])
+    response._content = entry["body"]
+    response.url = entry["url"]
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    response.from_cache = True
+    return response
+
+
+def cached_get(session, url, cache=None, timeout=15, before_request=None, **kwargs):
+    """session.get through an HTTPCache; the response has from_cache set.
+
+    before_request, if given, is called only when a request actually goes
+    out, e.g. to take a rate-limit token; fresh cache hits skip it.
+    """
+    if cache is None:
+        if before_request is not None:
+            before_request()
+        response = session.get(url, timeout=timeout, **kwargs)
+        response.from_cache = False
+        return response
+    entry = cache.lookup(url)
+    if entry is not None and cache.is_fresh(entry):
+        cache.record("hits", entry)
+        return _cached_response(entry)
+
+    headers = dict(kwargs.pop("headers", None) or {})
+    if entry is not None:
+        headers.update(cache.conditional_headers(entry))
+    if before_request is not None:
+        before_request()
+    response = session.get(url, headers=headers, timeout=timeout, **kwargs)
+    if response.status_code == 304 and entry is not None:
+        cache.refresh(url, response.headers)
+        cache.record("revalidated", entry)
+        return _cached_response(entry)
+    cache.record("misses")
+    cache.store(url, response.status_code, response.headers, response.content)
+    response.from_cache = False
+    return response
+
+
+async def async_cached_get(session, url, cache, timeout=30):
+    """aiohttp version of cached_get; returns (status, headers, body, from_cache).
+
+    Cache file and SQLite work runs in threads so it never blocks the event loop.
+    """
+    # Imported here so the requests-only scripts don't need aiohttp installed
+    import aiohttp
+
+    entry = await asyncio.to_thread(cache.lookup, url)
+    if entry is not None and cache.is_fresh(entry):
+        cache.record("hits", entry)
+        return entry["status"], CaseInsensitiveDict(entry["headers"]), entry["body"], True
+    headers = cache.conditional_headers(entry) if entry is not None else {}
+    async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+        body = await response.read()
+        response_headers = CaseInsensitiveDict(response.headers)
+        if response.status == 304 and entry is not None:
+            await asyncio.to_thread(cache.refresh, url, response_headers)
+            cache.record("revalidated", entry)
+            return entry["status"], CaseInsensitiveDict(entry["headers"]), entry["body"], True
+        cache.record("misses")
+        await asyncio.to_thread(cache.store, url, response.status, response_headers, body)
+        return response.status, response_headers, body, False
+
+
+class _DemoHandler(http.server.BaseHTTPRequestHandler):
+    # /fresh/... is cacheable for a minute, /etag/... must be revalidated, /nostore/... is never kept
+    protocol_version = "HTTP/1.1"
+    served = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        body = (self.path * 1000).encode()
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if self.path.startswith("/etag") and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        type(self).served += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        if self.path.startswith("/fresh"):
+            self.send_header("Cache-Control", "max-age=60")
+        elif self.path.startswith("/etag"):
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("ETag", etag)
+        else:
+            self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+
+if __name__ == "__main__":
+    import shutil
+    import tempfile
+
+    # Two passes over a local http.server: the second should mostly come from cache
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _DemoHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    urls = [f"{base}/{kind}/{i}" for kind in ("fresh", "etag", "nostore") for i in range(20)]
+
+    cache_dir = tempfile.mkdtemp()
+    # The 40 cacheable pages are ~8 KB each, so ~320 KB won't fit in 250 KB and
+    # the oldest are evicted. Run 2 walks the list backwards, so LRU keeps the
+    # pages it needs first and only the evicted ones are fetched again
+    cache = HTTPCache(cache_dir, max_bytes=250_000)
+    with requests.Session() as session:
+        for run, order in ((1, urls), (2, urls[::-1])):
+            before = _DemoHandler.served
+            start = time.perf_counter()
+            for url in order:
+                cached_get(session, url, cache).raise_for_status()
+            elapsed = time.perf_counter() - start
+            print(f"Run {run}: {_DemoHandler.served - before} full responses from the server in {elapsed:.2f}s")
+    cache.report()
+    cache.close()
+    server.shutdown()
+    shutil.rmtree(cache_dir)
@@ -1,23 +1,264 @@
-import requests
+import argparse
+import json
+import os
 import threading
+import time
+import urllib.robotparser
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+import requests
 from bs4 import BeautifulSoup
 
-urls = ['url1','url2','url3']
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+from http_cache import HTTPCache, cached_get
+from url_stream import iter_urls
+
+USER_AGENT = "SimplePythonTools-scraper/1.0"
+
+
+class TokenBucket:
+    """Allow `rate` requests per second on average, with bursts up to `burst`."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_for = (1 - self.tokens) / self.rate
+            # Sleep outside the lock so other domains' threads aren't held up
+            time.sleep(wait_for)
+
+
+class DomainPolicy:
+    """Per-domain token buckets and robots.txt rules, shared by all fetch threads.
+
+    A domain's robots.txt is fetched once, on first use. Its Crawl-delay
+    (or Request-rate) slows that domain's bucket below the default rate.
+    """
+
+    def __init__(self, session, rate=1.0, burst=2, user_agent=USER_AGENT, respect_robots=True, timeout=10):
+        self.session = session
+        self.rate = rate
+        self.burst = burst
+        self.user_agent = user_agent
+        self.respect_robots = respect_robots
+        self.timeout = timeout
+        self.domains = {}
+        self.lock = threading.Lock()
+
+    def _load(self, origin):
+        robots = None
+        rate, burst = self.rate, self.burst
+        if self.respect_robots:
+            robots = urllib.robotparser.RobotFileParser()
+            try:
+                response = self.session.get(origin + "/robots.txt", timeout=self.timeout)
+                if response.status_code in (401, 403):
+                    robots.disallow_all = True
+                elif response.ok:
+                    robots.parse(response.text.splitlines())
+                else:
+                    robots.allow_all = True
+            except requests.exceptions.RequestException:
+                robots.allow_all = True
+            delay = robots.crawl_delay(self.user_agent)
+            request_rate = robots.request_rate(self.user_agent)
+            # A rate with zero requests or zero seconds is meaningless, so ignore it
+            if request_rate and request_rate.requests > 0 and request_rate.seconds > 0:
+                rate = min(rate, request_rate.requests / request_rate.seconds)
+            if delay:
+                rate, burst = min(rate, 1.0 / float(delay)), 1
+        return {"robots": robots, "bucket": TokenBucket(rate, burst)}
+
+    def _domain(self, url):
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        with self.lock:
+            domain = self.domains.get(origin)
+            owner = domain is None
+            if owner:
+                domain = self.domains[origin] = {"ready": threading.Event()}
+        # Only the first thread for a domain fetches robots.txt; the rest wait for it
+        if owner:
+            try:
+                domain.update(self._load(origin))
+            finally:
+                # Never leave waiters hanging; fall back to no robots rules
+                domain.setdefault("robots", None)
+                domain.setdefault("bucket", TokenBucket(self.rate, self.burst))
+                domain["ready"].set()
+        else:
+            domain["ready"].wait()
+        return domain
+
+    def allowed(self, url):
+        robots = self._domain(url)["robots"]
+        return robots is None or robots.can_fetch(self.user_agent, url)
+
+    def wait(self, url):
+        self._domain(url)["bucket"].acquire()
+
+
+def fetch(session, policy, url, timeout=15, cache=None):
+    """Download one page politely; returns a record with "html" set for HTML pages."""
+    record = {"url": url, "status": None, "fetched_at": time.time()}
+    if not policy.allowed(url):
+        record["error"] = "disallowed by robots.txt"
+        return record
+    start = time.perf_counter()
+    try:
+        # Fresh cache hits make no request, so they don't spend a rate-limit token
+        response = cached_get(session, url, cache, timeout, before_request=lambda: policy.wait(url))
+    except requests.exceptions.RequestException as e:
+        record["error"] = str(e)
+        return record
+    record["status"] = response.status_code
+    record["final_url"] = response.url
+    record["from_cache"] = response.from_cache
+    record["seconds"] = round(time.perf_counter() - start, 3)
+    content_type = response.headers.get("Content-Type", "")
+    if not response.ok:
+        record["error"] = f"HTTP {response.status_code}"
+    elif "html" not in content_type:
+        record["error"] = f"not HTML ({content_type or 'no content type'})"
+    else:
+        # Raw bytes go to the parser process; BeautifulSoup detects the encoding
+        record["html"] = response.content
+    return record
+
+
+def parse_html(html):
+    """Extract title, visible text and links. Runs in a worker process."""
+    soup = BeautifulSoup(html, HTML_PARSER)
+    for tag in soup(["script", "style", "noscript"]):
+        tag.decompose()
+    title = soup.title.get_text(strip=True) if soup.title else None
+    links = [a["href"] for a in soup.find_all("a", href=True)]
+    text = " ".join(soup.get_text(" ").split())
+    return {"title": title, "text": text, "links": links}
+
+
+def scrape(
+    urls,
+    output_path="scraped.jsonl",
+    workers=16,
+    parse_workers=None,
+    rate=1.0,
+    burst=2,
+    timeout=15,
+    user_agent=USER_AGENT,
+    respect_robots=True,
+    cache=None,
+):
+    """Fetch pages on a bounded thread pool and parse them on a process pool.
+
+    At most 2 * workers pages are fetched or parsed at once, however
+    many URLs there are. Each result is appended to output_path as one
+    JSON line as soon as it is ready. `rate` and `burst` are per-domain
+    requests per second. With an http_cache.HTTPCache, pages still fresh
+    from an earlier run are served locally and stale ones revalidated.
+    """
+    max_in_flight = workers * 2
+    stats = {"pages": 0, "errors": 0}
+    start = time.perf_counter()
+
+    session = requests.Session()
+    session.headers["User-Agent"] = user_agent
+    # Enough pooled keep-alive connections for every fetch thread
+    adapter = requests.adapters.HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    policy = DomainPolicy(session, rate, burst, user_agent, respect_robots)
+
+    with session, ThreadPoolExecutor(max_workers=workers) as fetchers, \
+            ProcessPoolExecutor(max_workers=parse_workers) as parsers, \
+            open(output_path, "a", encoding="utf-8") as out:
+        pending = {}
+
+        def write(record):
+            stats["errors" if "error" in record else "pages"] += 1
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        def handle(done):
+            for future in done:
+                stage, record = pending.pop(future)
+                if stage == "fetch":
+                    try:
+                        record = future.result()
+                    except Exception as e:
+                        # One bad URL (or robots.txt) mustn't stop the whole scrape
+                        record["error"] = f"fetch failed: {e}"
+                        write(record)
+                        continue
+                    html = record.pop("html", None)
+                    if html is None:
+                        write(record)
+                    else:
+                        pending[parsers.submit(parse_html, html)] = ("parse", record)
+                    continue
+                try:
+                    record.update(future.result())
+                except Exception as e:
+                    record["error"] = f"parse failed: {e}"
+                write(record)
+            out.flush()
 
-threads=[]
+        for url in urls:
+            while len(pending) >= max_in_flight:
+                handle(wait(pending, return_when=FIRST_COMPLETED).done)
+            pending[fetchers.submit(fetch, session, policy, url, timeout, cache)] = ("fetch", {"url": url})
+        while pending:
+            handle(wait(pending, return_when=FIRST_COMPLETED).done)
 
-def fetch_content():
-  response = requests.get(url)
-  soup = BeautifulSoup(response.content,'html.parser')
-  print(soup.text)
+    elapsed = time.perf_counter() - start
+    print(f"Scraped {stats['pages']} pages ({stats['errors']} errors) in {elapsed:.1f}s to {output_path}")
+    if cache is not None:
+        cache.report()
+    return stats
 
 
-for url in urls:
-  thread=threading.Thread(fetch_content, args=(url,))
-  threads.append(thread)
-  thread.start()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape page text from a list of URLs to JSONL")
+    parser.add_argument("urls_file", help="text file with one URL per line, or a CSV with --column")
+    parser.add_argument("--column", help="URL column when urls_file is a CSV")
+    parser.add_argument("--output", default="scraped.jsonl")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--parse-workers", type=int, default=os.cpu_count())
+    parser.add_argument("--rate", type=float, default=1.0, help="requests per second per domain")
+    parser.add_argument("--burst", type=int, default=2)
+    parser.add_argument("--ignore-robots", action="store_true")
+    parser.add_argument("--cache-dir", help="keep an HTTP cache here between runs")
+    parser.add_argument("--cache-size-mb", type=int, default=1024)
+    args = parser.parse_args()
 
-for thread in threads:
-  thread.join()
+    cache = HTTPCache(args.cache_dir, args.cache_size_mb << 20) if args.cache_dir else None
 
-print("data Fetched simultaneously")
+    scrape(
+        iter_urls(args.urls_file, args.column),
+        args.output,
+        workers=args.workers,
+        parse_workers=args.parse_workers,
+        rate=args.rate,
+        burst=args.burst,
+        respect_robots=not args.ignore_robots,
+        cache=cache,
+    )
+    if cache is not None:
+        cache.close()
@@ -1,34 +1,146 @@
-import csv
-
-# Define seat mappings
-seat_mappings = {
-    'FRONT': [9,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,30,31,32],
-    'MIDDLE': [1,2,3,4,5,6,7,8],
-    'FIFTH': [33,34,35,36,37,39],
-    'DOUBLE': [41,42,44,45],
-    'BACK': [43,38]
-}
-
-# Input and output file names
-input_file = 'fares.csv'
-output_file = 'output.csv'
-
-# Read input CSV and write to output CSV
-with open(input_file, 'r') as infile, open(output_file, 'w', newline='') as outfile:
-    reader = csv.reader(infile)
-    writer = csv.writer(outfile)
-    
-    # Write header
-    header = next(reader)
-    writer.writerow(header)
-    
-    # Process rows
-    for row in reader:
-        route, classification, base_fare, seat_bucket = row
-        if seat_bucket in seat_mappings:
-            for seat_number in seat_mappings[seat_bucket]:
-                writer.writerow([route, classification, base_fare, seat_number])
-        else:
-            writer.writerow(row)
-
-print(f"Processing complete. Output written to {output_file}")
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# Seat buckets per bus layout: {"layout": {"BUCKET": [seat numbers]}}
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "seat_layouts.json")
+
+
+def load_seat_mappings(config_file=DEFAULT_CONFIG):
+    # Flatten the config into one (layout, bucket, seat) row per seat, in config order
+    with open(config_file) as f:
+        layouts = json.load(f)
+    rows = [
+        (layout, bucket, str(seat))
+        for layout, buckets in layouts.items()
+        for bucket, seats in buckets.items()
+        for seat in seats
+    ]
+    return pd.DataFrame(rows, columns=["_layout", "_bucket", "_seat"])
+
+
+def expand_chunk(chunk, seat_mappings, bucket_column, layout_column=None, default_layout="default"):
+    # One merge against the seat table expands every mapped bucket into one
+    # output row per seat. Returns, per output row, the input row position and
+    # the value for the bucket column: the seat number, or the bucket itself
+    # for unmapped rows, which pass through unchanged as before. Row order and
+    # seat order are preserved
+    keyed = pd.DataFrame({
+        "_layout": chunk[layout_column].to_numpy() if layout_column else default_layout,
+        "_bucket": chunk[bucket_column].to_numpy(),
+        "_row": np.arange(len(chunk)),
+    })
+    merged = keyed.merge(seat_mappings, on=["_layout", "_bucket"], how="left", sort=False)
+    return merged["_row"].to_numpy(), merged["_seat"].fillna(merged["_bucket"]).to_numpy()
+
+
+def expanded_frame(chunk, rows, seats, bucket_column):
+    frame = chunk.iloc[rows].reset_index(drop=True)
+    frame[bucket_column] = seats
+    return frame
+
+
+def _csv_field(value):
+    # Same quoting as csv.writer's QUOTE_MINIMAL
+    if any(c in value for c in ',"\r\n'):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def _csv_column(values):
+    # Columns repeat a handful of values (seats, routes, fares), so quote each
+    # distinct value once and gather
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    quoted = np.array([_csv_field(value) for value in uniques] + [""], dtype=object)
+    return quoted[codes]
+
+
+def _render_rows(chunk, columns):
+    # Each input row's fields joined as CSV text, one string per row
+    rendered = [_csv_column(chunk[column].to_numpy()) for column in columns]
+    text = rendered[0]
+    for column in rendered[1:]:
+        text = text + "," + column
+    return text
+
+
+class ExpandedWriter:
+    # Appends expanded chunks to a CSV or Parquet file (chosen by extension)
+    def __init__(self, output_file):
+        self.output_file = output_file
+        self.parquet = output_file.lower().endswith((".parquet", ".pq"))
+        self.parquet_writer = None
+        self.csv_file = None
+
+    def write(self, chunk, rows, seats, bucket_column):
+        if self.parquet:
+            # pyarrow is only needed for Parquet output
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(expanded_frame(chunk, rows, seats, bucket_column), preserve_index=False)
+            if self.parquet_writer is None:
+                self.parquet_writer = pq.ParquetWriter(self.output_file, table.schema)
+            self.parquet_writer.write_table(table)
+            return
+
+        if self.csv_file is None:
+            self.csv_file = open(self.output_file, "w", newline="")
+            self.csv_file.write(",".join(_csv_column(chunk.columns)) + "\r\n")
+        # The other columns are rendered once per input row and reused for
+        # each of its seats, instead of formatting every output row from scratch
+        position = chunk.columns.get_loc(bucket_column)
+        lines = _csv_column(seats)
+        if position > 0:
+            lines = _render_rows(chunk, chunk.columns[:position])[rows] + "," + lines
+        if position < len(chunk.columns) - 1:
+            lines = lines + "," + _render_rows(chunk, chunk.columns[position + 1:])[rows]
+        if len(lines):
+            self.csv_file.write("\r\n".join(lines) + "\r\n")
+
+    def close(self):
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+        if self.csv_file is not None:
+            self.csv_file.close()
+
+
+def expand_fares(input_file="fares.csv", output_file="output.csv", config_file=DEFAULT_CONFIG,
+                 default_layout="default", layout_column="layout", bucket_column=None, chunksize=500_000):
+    # Stream the fares table in chunks so memory stays flat however many
+    # routes x classifications x dates there are. Rows use their own layout
+    # if the input has a `layout_column`, else `default_layout`. The seat
+    # bucket column defaults to the last column (route, classification,
+    # base_fare, seatid in our fares files)
+    seat_mappings = load_seat_mappings(config_file)
+    writer = ExpandedWriter(output_file)
+    rows_in = rows_out = 0
+    try:
+        # Everything is read as text so fares are written back exactly as given
+        for chunk in pd.read_csv(input_file, dtype=str, keep_default_na=False, chunksize=chunksize):
+            bucket_column = bucket_column or chunk.columns[-1]
+            rows, seats = expand_chunk(
+                chunk, seat_mappings, bucket_column,
+                layout_column if layout_column in chunk.columns else None, default_layout,
+            )
+            writer.write(chunk, rows, seats, bucket_column)
+            rows_in += len(chunk)
+            rows_out += len(rows)
+    finally:
+        writer.close()
+    print(f"Processing complete. Expanded {rows_in} rows into {rows_out}, written to {output_file}")
+    return rows_out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Expand seat-bucket fare rows into per-seat rows")
+    parser.add_argument("input_file", nargs="?", default="fares.csv")
+    parser.add_argument("output_file", nargs="?", default="output.csv", help=".csv or .parquet")
+    parser.add_argument("--config", default=DEFAULT_CONFIG, help="seat layouts JSON")
+    parser.add_argument("--layout", default="default", help="layout for rows without a layout column")
+    parser.add_argument("--chunksize", type=int, default=500_000)
+    args = parser.parse_args()
+    expand_fares(args.input_file, args.output_file, args.config, args.layout, chunksize=args.chunksize)
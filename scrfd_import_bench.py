@@ -0,0 +1,48 @@
+import argparse
+import subprocess
+import sys
+
+# Runs in a fresh interpreter so nothing is already imported or cached
+_PROBE = """
+import resource, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(elapsed, rss_kb)
+"""
+
+
+def measure_import(module, repeats=3):
+    """Best-of-N cold import time (s) and peak RSS (MB) of a module."""
+    times = []
+    rss_mb = 0.0
+    for _ in range(repeats):
+        output = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(module=module)],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        elapsed, rss_kb = output.split()
+        times.append(float(elapsed))
+        # ru_maxrss is in kilobytes on Linux
+        rss_mb = max(rss_mb, int(rss_kb) / 1024.0)
+    return min(times), rss_mb
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold import time and RSS per module")
+    parser.add_argument(
+        "modules", nargs="*", default=["numpy", "cv2", "onnxruntime", "SCRFD_class", "torch"]
+    )
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    for module in args.modules:
+        try:
+            elapsed, rss_mb = measure_import(module, args.repeats)
+        except subprocess.CalledProcessError:
+            print(f"{module:<16} not importable")
+            continue
+        print(f"{module:<16} {elapsed * 1000:8.1f} ms {rss_mb:8.1f} MB RSS")
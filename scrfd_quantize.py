@@ -0,0 +1,218 @@
+import argparse
+import json
+import os
+import os.path as osp
+import time
+
+import cv2
+import numpy as np
+from onnxruntime.quantization import (
+    CalibrationDataReader,
+    QuantFormat,
+    QuantType,
+    quantize_dynamic,
+    quantize_static,
+)
+from onnxruntime.quantization.shape_inference import quant_pre_process
+
+from SCRFD_class import IMAGE_EXTENSIONS, SCRFD, box_iou
+
+
+def list_images(folder):
+    return sorted(
+        os.path.join(folder, f)
+        for f in os.listdir(folder)
+        if f.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+class SCRFDCalibrationReader(CalibrationDataReader):
+    """Feeds letterboxed calibration images to the static quantizer."""
+
+    def __init__(self, model_file, image_folder, input_size=(640, 640), max_images=200):
+        # Reuse the detector's own preprocessing so calibration sees real inputs
+        self.detector = SCRFD(model_file)
+        self.input_size = input_size
+        self.image_paths = list_images(image_folder)[:max_images]
+        self.index = 0
+
+    def get_next(self):
+        while self.index < len(self.image_paths):
+            image = cv2.imread(self.image_paths[self.index])
+            self.index += 1
+            if image is None:
+                continue
+            buffers, _ = self.detector._preprocess([image], self.input_size)
+            return {self.detector.input_name: buffers["blob"].copy()}
+        return None
+
+    def rewind(self):
+        self.index = 0
+
+
+def quantize_model(
+    model_file, output_file, mode="dynamic", calib_folder=None, input_size=(640, 640)
+):
+    """Write an INT8 copy of an SCRFD model.
+
+    Args:
+        model_file (str): FP32 SCRFD ONNX model.
+        output_file (str): Where to write the quantized model.
+        mode (str): "dynamic" (weights only, no data needed) or "static"
+            (QDQ activations calibrated on calib_folder).
+        calib_folder (str): Folder of representative images for "static".
+        input_size (tuple): Detector input (width, height) used for calibration.
+
+    Returns:
+        str: output_file, loadable with SCRFD(output_file).
+    """
+    if mode == "dynamic":
+        quantize_dynamic(model_file, output_file, weight_type=QuantType.QInt8)
+    elif mode == "static":
+        assert calib_folder is not None, "static quantization needs calib_folder"
+        prepared_file = output_file + ".prep.onnx"
+        # Dynamic H/W inputs trip up symbolic shape inference, ONNX shapes suffice
+        quant_pre_process(model_file, prepared_file, skip_symbolic_shape=True)
+        try:
+            reader = SCRFDCalibrationReader(model_file, calib_folder, input_size)
+            quantize_static(
+                prepared_file,
+                output_file,
+                reader,
+                quant_format=QuantFormat.QDQ,
+                activation_type=QuantType.QUInt8,
+                weight_type=QuantType.QInt8,
+                per_channel=True,
+            )
+        finally:
+            os.remove(prepared_file)
+    else:
+        raise ValueError(f"Unknown quantization mode: {mode}")
+    return output_file
+
+
+def match_faces(gt_boxes, pred_boxes, iou_thresh=0.5):
+    """Greedy one-to-one matching, best IoU first. Returns (gt_idx, pred_idx) pairs."""
+    if len(gt_boxes) == 0 or len(pred_boxes) == 0:
+        return []
+    ious = box_iou(gt_boxes, pred_boxes)
+    pairs = []
+    used_gt = set()
+    used_pred = set()
+    for flat in np.argsort(ious, axis=None)[::-1]:
+        g, p = np.unravel_index(flat, ious.shape)
+        if ious[g, p] < iou_thresh:
+            break
+        if g in used_gt or p in used_pred:
+            continue
+        used_gt.add(g)
+        used_pred.add(p)
+        pairs.append((g, p))
+    return pairs
+
+
+def load_labels(labels_file):
+    """Labels JSON: {"image.jpg": [{"bbox": [x1, y1, x2, y2], "kps": [[x, y], ...]}]}."""
+    with open(labels_file) as f:
+        return json.load(f)
+
+
+def evaluate(detector, image_paths, labels, input_size, thresh=0.5):
+    total_gt = 0
+    matched = 0
+    kps_errors = []
+    latencies = []
+    for path in image_paths:
+        image = cv2.imread(path)
+        if image is None:
+            continue
+        start = time.perf_counter()
+        bboxes, landmarks = detector.detect(image, thresh=thresh, input_size=input_size)
+        latencies.append(time.perf_counter() - start)
+
+        faces = labels.get(osp.basename(path), [])
+        gt_boxes = [face["bbox"] for face in faces]
+        total_gt += len(gt_boxes)
+        pairs = match_faces(gt_boxes, bboxes[:, :4])
+        matched += len(pairs)
+        for g, p in pairs:
+            gt_kps = faces[g].get("kps")
+            if gt_kps is None or landmarks.ndim != 3:
+                continue
+            # Normalize by face size so small and large faces weigh the same
+            x1, y1, x2, y2 = gt_boxes[g]
+            face_size = max(np.sqrt((x2 - x1) * (y2 - y1)), 1.0)
+            dists = np.linalg.norm(landmarks[p] - np.asarray(gt_kps), axis=1)
+            kps_errors.append(dists.mean() / face_size)
+
+    latencies = np.asarray(latencies) * 1000.0
+    return {
+        "recall@0.5": matched / total_gt if total_gt else float("nan"),
+        "kps_nme": float(np.mean(kps_errors)) if kps_errors else float("nan"),
+        "mean_ms": float(latencies.mean()) if len(latencies) else float("nan"),
+        "p95_ms": float(np.percentile(latencies, 95)) if len(latencies) else float("nan"),
+    }
+
+
+def pseudo_labels(detector, image_paths, input_size, thresh=0.5):
+    """Use a model's own detections as labels, e.g. FP32 output as reference."""
+    labels = {}
+    for path in image_paths:
+        image = cv2.imread(path)
+        if image is None:
+            continue
+        bboxes, landmarks = detector.detect(image, thresh=thresh, input_size=input_size)
+        labels[osp.basename(path)] = [
+            {
+                "bbox": bboxes[i, :4].tolist(),
+                "kps": landmarks[i].tolist() if landmarks.ndim == 3 else None,
+            }
+            for i in range(len(bboxes))
+        ]
+    return labels
+
+
+def compare_models(
+    fp32_file, int8_file, eval_folder, labels_file=None, input_size=(640, 640), thresh=0.5
+):
+    """Print recall, keypoint error and latency for the FP32 and INT8 models side by side."""
+    image_paths = list_images(eval_folder)
+    fp32 = SCRFD(fp32_file)
+    int8 = SCRFD(int8_file)
+    if labels_file is not None:
+        labels = load_labels(labels_file)
+    else:
+        print("No labels given, scoring against FP32 detections")
+        labels = pseudo_labels(fp32, image_paths, input_size, thresh)
+
+    reports = {
+        "fp32": evaluate(fp32, image_paths, labels, input_size, thresh),
+        "int8": evaluate(int8, image_paths, labels, input_size, thresh),
+    }
+    print(f"{'metric':<12}{'fp32':>12}{'int8':>12}")
+    for metric in reports["fp32"]:
+        print(f"{metric:<12}{reports['fp32'][metric]:>12.4f}{reports['int8'][metric]:>12.4f}")
+    return reports
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quantize an SCRFD model to INT8")
+    parser.add_argument("model_file")
+    parser.add_argument("--output", help="defaults to <model>.int8.onnx")
+    parser.add_argument("--mode", choices=["dynamic", "static"], default="dynamic")
+    parser.add_argument("--calib-folder", help="calibration images for --mode static")
+    parser.add_argument("--eval-folder", help="images for the FP32 vs INT8 report")
+    parser.add_argument("--labels", help="labels JSON for --eval-folder")
+    parser.add_argument("--input-size", type=int, nargs=2, default=[640, 640])
+    parser.add_argument("--thresh", type=float, default=0.5)
+    args = parser.parse_args()
+
+    output_file = args.output or osp.splitext(args.model_file)[0] + ".int8.onnx"
+    input_size = tuple(args.input_size)
+    quantize_model(args.model_file, output_file, args.mode, args.calib_folder, input_size)
+    print(f"Quantized model written to {output_file}")
+
+    if args.eval_folder:
+        compare_models(
+            args.model_file, output_file, args.eval_folder, args.labels, input_size, args.thresh
+        )
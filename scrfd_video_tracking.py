@@ -0,0 +1,326 @@
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from SCRFD_class import IMAGE_EXTENSIONS, SCRFD, box_iou
+
+# Marks the end of the stream on every queue
+_STOP = object()
+
+
+class _WorkerError:
+    """Carries an exception from a worker thread to run(), which re-raises it."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def _put(q, item, stop):
+    """Put unless run() has stopped; returns False if it gave up."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q, stop):
+    """Get the next item, or _STOP once run() has stopped."""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _STOP
+
+
+def iter_frames(source):
+    """Yield (frame_idx, frame) from a video file or a folder of images."""
+    if os.path.isdir(source):
+        names = sorted(f for f in os.listdir(source) if f.lower().endswith(IMAGE_EXTENSIONS))
+        for frame_idx, name in enumerate(names):
+            frame = cv2.imread(os.path.join(source, name))
+            if frame is not None:
+                yield frame_idx, frame
+        return
+
+    capture = cv2.VideoCapture(source)
+    frame_idx = 0
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            yield frame_idx, frame
+            frame_idx += 1
+    finally:
+        capture.release()
+
+
+class KalmanBoxTrack:
+    """Constant-velocity Kalman filter over a box as (cx, cy, w, h)."""
+
+    # Transition and observation matrices are shared by every track
+    F = np.eye(8)
+    F[:4, 4:] = np.eye(4)
+    H = np.eye(4, 8)
+
+    def __init__(self, track_id, bbox, score):
+        self.track_id = track_id
+        self.score = score
+        self.hits = 1
+        self.misses = 0
+        self.x = np.zeros(8)
+        self.x[:4] = self._to_cxcywh(bbox)
+        self.P = np.diag([10.0, 10.0, 10.0, 10.0, 1000.0, 1000.0, 1000.0, 1000.0])
+        self.Q = np.diag([1.0, 1.0, 1.0, 1.0, 0.01, 0.01, 0.01, 0.01])
+        self.R = np.diag([1.0, 1.0, 10.0, 10.0])
+
+    @staticmethod
+    def _to_cxcywh(bbox):
+        x1, y1, x2, y2 = bbox[:4]
+        return np.array([(x1 + x2) / 2.0, (y1 + y2) / 2.0, x2 - x1, y2 - y1])
+
+    @property
+    def bbox(self):
+        cx, cy, w, h = self.x[:4]
+        return np.array([cx - w / 2.0, cy - h / 2.0, cx + w / 2.0, cy + h / 2.0])
+
+    def predict(self):
+        self.x = self.F @ self.x
+        # Don't let a shrinking box go negative between detections
+        self.x[2:4] = np.maximum(self.x[2:4], 1.0)
+        self.P = self.F @ self.P @ self.F.T + self.Q
+
+    def update(self, bbox, score):
+        y = self._to_cxcywh(bbox) - self.H @ self.x
+        S = self.H @ self.P @ self.H.T + self.R
+        K = self.P @ self.H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ y
+        self.P = (np.eye(8) - K @ self.H) @ self.P
+        self.score = score
+        self.hits += 1
+        self.misses = 0
+
+
+class IoUTracker:
+    """Greedy IoU association of detections to Kalman-predicted tracks."""
+
+    def __init__(self, iou_thresh=0.3, max_misses=3):
+        self.iou_thresh = iou_thresh
+        # Detection rounds a track may go unmatched before it is dropped
+        self.max_misses = max_misses
+        self.tracks = []
+        self.next_id = 1
+
+    def predict(self):
+        for track in self.tracks:
+            track.predict()
+        return self.tracks
+
+    def update(self, bboxes, scores):
+        """Match one frame's detections; call after predict() on detection frames."""
+        matched_dets = set()
+        matched_tracks = set()
+        if self.tracks and len(bboxes):
+            track_boxes = np.array([track.bbox for track in self.tracks])
+            ious = box_iou(track_boxes, np.asarray(bboxes, dtype=np.float64)[:, :4])
+            for flat in np.argsort(ious, axis=None)[::-1]:
+                t, d = np.unravel_index(flat, ious.shape)
+                if ious[t, d] < self.iou_thresh:
+                    break
+                if t in matched_tracks or d in matched_dets:
+                    continue
+                self.tracks[t].update(bboxes[d], scores[d])
+                matched_tracks.add(t)
+                matched_dets.add(d)
+
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.misses += 1
+        self.tracks = [track for track in self.tracks if track.misses <= self.max_misses]
+
+        for d in range(len(bboxes)):
+            if d not in matched_dets:
+                self.tracks.append(KalmanBoxTrack(self.next_id, bboxes[d], scores[d]))
+                self.next_id += 1
+        return self.tracks
+
+
+class VideoFaceTracker:
+    """Decode -> detect every N frames -> track, with bounded queues between stages.
+
+    Decoding and detection run in their own threads so they overlap with
+    tracking and crop writing on the caller's thread. ONNX Runtime and
+    OpenCV release the GIL while they work.
+    """
+
+    def __init__(
+        self,
+        detector,
+        output_folder,
+        detect_every=5,
+        thresh=0.5,
+        input_size=(640, 640),
+        queue_size=16,
+        iou_thresh=0.3,
+        max_misses=3,
+    ):
+        self.detector = detector
+        self.output_folder = output_folder
+        self.detect_every = detect_every
+        self.thresh = thresh
+        self.input_size = input_size
+        self.queue_size = queue_size
+        self.tracker = IoUTracker(iou_thresh, max_misses)
+
+    def _decode_worker(self, source, frames_queue, stop):
+        # Always ends the stream with _STOP, after any error, so nothing downstream hangs
+        try:
+            for frame_idx, frame in iter_frames(source):
+                if not _put(frames_queue, (frame_idx, frame), stop):
+                    return
+        except Exception as e:
+            _put(frames_queue, _WorkerError(e), stop)
+        finally:
+            _put(frames_queue, _STOP, stop)
+
+    def _detect_worker(self, frames_queue, results_queue, stop):
+        try:
+            while True:
+                item = _get(frames_queue, stop)
+                if item is _STOP:
+                    return
+                if isinstance(item, _WorkerError):
+                    _put(results_queue, item, stop)
+                    return
+                frame_idx, frame = item
+                detections = None
+                if frame_idx % self.detect_every == 0:
+                    det, _, bboxes, _ = self.detector.detect_tracking(
+                        frame, self.thresh, self.input_size, return_numpy=True
+                    )
+                    scores = det[:, 4]
+                    detections = (bboxes[:, :4], scores)
+                if not _put(results_queue, (frame_idx, frame, detections), stop):
+                    return
+        except Exception as e:
+            _put(results_queue, _WorkerError(e), stop)
+        finally:
+            _put(results_queue, _STOP, stop)
+
+    def _save_crop(self, frame, track, frame_idx):
+        height, width = frame.shape[:2]
+        x1, y1, x2, y2 = np.int32(np.round(track.bbox))
+        x1, y1 = max(x1, 0), max(y1, 0)
+        x2, y2 = min(x2, width), min(y2, height)
+        if x2 <= x1 or y2 <= y1:
+            return None
+        track_folder = os.path.join(self.output_folder, f"track_{track.track_id}")
+        os.makedirs(track_folder, exist_ok=True)
+        crop_path = os.path.join(track_folder, f"{frame_idx:06d}.jpg")
+        cv2.imwrite(crop_path, frame[y1:y2, x1:x2])
+        return crop_path
+
+    def run(self, source, log_name="tracks.jsonl"):
+        """Process a video file or image folder; returns throughput stats."""
+        os.makedirs(self.output_folder, exist_ok=True)
+        frames_queue = queue.Queue(maxsize=self.queue_size)
+        results_queue = queue.Queue(maxsize=self.queue_size)
+        # Set when run() exits early, so workers blocked on a full or empty queue can quit
+        stop = threading.Event()
+        workers = [
+            threading.Thread(
+                target=self._decode_worker, args=(source, frames_queue, stop), daemon=True
+            ),
+            threading.Thread(
+                target=self._detect_worker, args=(frames_queue, results_queue, stop), daemon=True
+            ),
+        ]
+        for worker in workers:
+            worker.start()
+
+        frames = 0
+        detection_frames = 0
+        start = time.perf_counter()
+        try:
+            with open(os.path.join(self.output_folder, log_name), "w") as log:
+                while True:
+                    item = results_queue.get()
+                    if item is _STOP:
+                        break
+                    if isinstance(item, _WorkerError):
+                        raise item.error
+                    frame_idx, frame, detections = item
+                    frames += 1
+                    tracks = self.tracker.predict()
+                    if detections is not None:
+                        detection_frames += 1
+                        tracks = self.tracker.update(*detections)
+                    for track in tracks:
+                        # On detection frames, skip tracks that went unmatched
+                        if track.misses > 0 and detections is not None:
+                            continue
+                        # Crops are written only on detection frames, where boxes are measured
+                        crop_path = (
+                            self._save_crop(frame, track, frame_idx)
+                            if detections is not None
+                            else None
+                        )
+                        record = {
+                            "frame": frame_idx,
+                            "track_id": track.track_id,
+                            "bbox": [round(float(v), 1) for v in track.bbox],
+                            "score": float(track.score),
+                            "detected": detections is not None,
+                            "crop": crop_path,
+                        }
+                        log.write(json.dumps(record) + "\n")
+        finally:
+            # Unblock the workers if we're leaving early, then wait for them
+            stop.set()
+            for worker in workers:
+                worker.join()
+        elapsed = time.perf_counter() - start
+        stats = {
+            "frames": frames,
+            "detection_frames": detection_frames,
+            "tracks": self.tracker.next_id - 1,
+            "fps": frames / elapsed if elapsed > 0 else 0.0,
+        }
+        print(
+            f"Processed {frames} frames ({detection_frames} detected) "
+            f"at {stats['fps']:.1f} fps, {stats['tracks']} tracks"
+        )
+        return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Face detection and tracking on video")
+    parser.add_argument("model_file")
+    parser.add_argument("source", help="video file or folder of frames")
+    parser.add_argument("--output", default="tracks")
+    parser.add_argument("--detect-every", type=int, default=5)
+    parser.add_argument("--thresh", type=float, default=0.5)
+    parser.add_argument("--input-size", type=int, nargs=2, default=[640, 640])
+    parser.add_argument("--queue-size", type=int, default=16)
+    args = parser.parse_args()
+
+    detector = SCRFD(args.model_file)
+    pipeline = VideoFaceTracker(
+        detector,
+        args.output,
+        detect_every=args.detect_every,
+        thresh=args.thresh,
+        input_size=tuple(args.input_size),
+        queue_size=args.queue_size,
+    )
+    pipeline.run(args.source)
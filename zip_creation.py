@@ -1,29 +1,391 @@
 import os
+import re
+import json
+import queue
+import threading
 import zipfile
 import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-def create_zips(input_folder, veh_guid, imei):
-    # Get all image files in the input folder
-    image_files = [f for f in os.listdir(input_folder) if os.path.isfile(os.path.join(input_folder, f))]
-
-    # Create zip files in batches of 10
-    for i in range(0, len(image_files), 10):
-        # Generate a timestamp
-        timestamp = str(int(time.time()))
-        
-        # Create the zip filename
-        zip_filename = f"{veh_guid}_{imei}_{timestamp}_{i//10 + 1}.zip"
-        zip_filepath = os.path.join(input_folder, zip_filename)
-        
-        # Create a new zip file
-        with zipfile.ZipFile(zip_filepath, 'w') as zipf:
-            for image_file in image_files[i:i + 10]:
-                zipf.write(os.path.join(input_folder, image_file), image_file)
-        
-        print(f"Created {zip_filename}")
-
-# Example usage
-input_folder = "/home/narravenkataraghucharan/Downloads/Spy-2/Spy"  # Replace with the path to your folder
-veh_guid = "VEHherom-otoc-orpp-ocHM-C$0000000001"                    # Replace with your vehGuid
-imei = "67r8r"                           # Replace with your imei
-create_zips(input_folder, veh_guid, imei)
+# Formats that are already compressed; deflating them again costs CPU for ~0% gain
+STORED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.mp4', '.zip', '.gz'}
+
+# Our own archives, temp files and state are never inputs
+SKIP_SUFFIXES = ('.zip', '.tmp', '.part')
+
+
+def is_input_name(name):
+    # Hidden files (like the watermark) and our own outputs are skipped
+    return not name.startswith('.') and not name.endswith(SKIP_SUFFIXES)
+
+
+def scan_files(input_folder, watermark=None, settle_seconds=0):
+    # One os.scandir pass: is_file() comes from the directory entry itself, so
+    # each file costs a single stat (for size and mtime) instead of several.
+    # Returns (name, size, mtime_ns) oldest first, skipping files already
+    # covered by the watermark or modified in the last settle_seconds
+    cutoff = time.time_ns() - int(settle_seconds * 1e9)
+    files = []
+    with os.scandir(input_folder) as entries:
+        for entry in entries:
+            name = entry.name
+            if not is_input_name(name) or not entry.is_file():
+                continue
+            stat = entry.stat()
+            if stat.st_mtime_ns > cutoff:  # Possibly still being written
+                continue
+            if watermark and not is_new(watermark, name, stat.st_mtime_ns):
+                continue
+            files.append((name, stat.st_size, stat.st_mtime_ns))
+    files.sort(key=lambda f: (f[2], f[0]))
+    return files
+
+
+def is_new(watermark, name, mtime_ns):
+    # Everything up to the watermark's mtime is packed, plus the named files at exactly that mtime
+    return mtime_ns > watermark['mtime_ns'] or (mtime_ns == watermark['mtime_ns'] and name not in watermark['names'])
+
+
+def load_watermark(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'mtime_ns': -1, 'names': []}
+
+
+def save_watermark(path, watermark, files, sequence=None):
+    # Move the watermark past the newest packed file and save it atomically.
+    # Streaming mode also keeps its archive sequence number here
+    if not files:
+        return watermark
+    newest = max(mtime_ns for _, _, mtime_ns in files)
+    names = {name for name, _, mtime_ns in files if mtime_ns == newest}
+    if newest == watermark['mtime_ns']:
+        names |= set(watermark['names'])
+    watermark = {'mtime_ns': newest, 'names': sorted(names), 'sequence': sequence or watermark.get('sequence', 0)}
+    with open(path + '.tmp', 'w') as f:
+        json.dump(watermark, f)
+    os.replace(path + '.tmp', path)
+    return watermark
+
+
+def plan_batches(files, batch_size=10, max_batch_bytes=None):
+    # Split (name, size, ...) tuples into batches of at most batch_size files and,
+    # if given, max_batch_bytes; a file bigger than the byte limit goes alone
+    batches = []
+    batch, batch_bytes = [], 0
+    for name, size, *_ in files:
+        full = batch_size is not None and len(batch) >= batch_size
+        too_big = max_batch_bytes is not None and batch and batch_bytes + size > max_batch_bytes
+        if full or too_big:
+            batches.append(batch)
+            batch, batch_bytes = [], 0
+        batch.append(name)
+        batch_bytes += size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def build_zip(input_folder, names, zip_filepath, compresslevel=6):
+    # Runs in a worker process. Writes to a temp name and renames it into place,
+    # so nothing ever picks up a half-written archive. Files deleted or rotated
+    # away since the scan are left out; returns None if none were left
+    temp_filepath = zip_filepath + '.tmp'
+    written = 0
+    with zipfile.ZipFile(temp_filepath, 'w', zipfile.ZIP_DEFLATED, compresslevel=compresslevel) as zipf:
+        for name in names:
+            extension = os.path.splitext(name)[1].lower()
+            compression = zipfile.ZIP_STORED if extension in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+            try:
+                zipf.write(os.path.join(input_folder, name), name, compress_type=compression)
+            except FileNotFoundError:
+                print(f"Skipped {name}: removed before it was packed")
+                continue
+            written += 1
+    if not written:
+        os.remove(temp_filepath)
+        return None
+    os.replace(temp_filepath, zip_filepath)
+    return zip_filepath
+
+
+def next_sequence(output_folder, prefix):
+    # Continue numbering after the highest archive already in the folder
+    pattern = re.compile(re.escape(prefix) + r'_(\d+)_\d+\.zip$')
+    sequences = [int(m.group(1)) for m in map(pattern.match, os.listdir(output_folder)) if m]
+    return max(sequences, default=0) + 1
+
+
+def create_zips(input_folder, veh_guid, imei, batch_size=10, max_batch_bytes=None,
+                output_folder=None, workers=None, compresslevel=6, incremental=False, settle_seconds=0):
+    # Archives are named <veh_guid>_<imei>_<sequence>_<timestamp>.zip. The
+    # sequence keeps increasing across runs, so names never collide even when
+    # several batches finish in the same second (one packer per folder).
+    # With incremental=True only files newer than the saved watermark are
+    # packed, and the watermark moves forward once every archive is written.
+    # It also keeps the last sequence number, so a pass doesn't have to list
+    # the output folder (which collects every archive we ever wrote)
+    output_folder = output_folder or input_folder
+    os.makedirs(output_folder, exist_ok=True)
+    prefix = f"{veh_guid}_{imei}"
+
+    watermark_path = os.path.join(output_folder, f".{prefix}.watermark.json")
+    watermark = load_watermark(watermark_path) if incremental else None
+    files = scan_files(input_folder, watermark, settle_seconds)
+    if not files:
+        return []
+    batches = plan_batches(files, batch_size, max_batch_bytes)
+
+    if watermark and watermark.get('sequence'):
+        sequence = watermark['sequence'] + 1
+    else:
+        sequence = next_sequence(output_folder, prefix)
+    timestamp = str(int(time.time()))
+
+    # Batches are independent, so build them in parallel
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = []
+        for offset, batch in enumerate(batches):
+            zip_filename = f"{prefix}_{sequence + offset:06d}_{timestamp}.zip"
+            zip_filepath = os.path.join(output_folder, zip_filename)
+            futures.append(executor.submit(build_zip, input_folder, batch, zip_filepath, compresslevel))
+        created = []
+        for future in futures:
+            zip_filepath = future.result()
+            if zip_filepath is not None:
+                created.append(zip_filepath)
+                print(f"Created {os.path.basename(zip_filepath)}")
+
+    if incremental:
+        save_watermark(watermark_path, watermark, files, sequence + len(batches) - 1)
+    elapsed = time.perf_counter() - start
+    total_bytes = sum(size for _, size, _ in files)
+    print(f"Packed {len(files)} files ({total_bytes / 1e6:.1f} MB) into {len(created)} archives in {elapsed:.1f}s")
+    return created
+
+
+class UploadAborted(Exception):
+    pass
+
+
+# Marks the end of an archive in a ChunkPipe
+_EOF = object()
+
+
+class ChunkPipe:
+    # Write end for zipfile, read end for an uploader. At most max_chunks
+    # chunks of chunk_size bytes are buffered; the zip writer blocks when the
+    # uploader falls behind, so memory stays bounded and nothing touches disk
+    def __init__(self, chunk_size=1 << 20, max_chunks=8):
+        self.chunk_size = chunk_size
+        self.queue = queue.Queue(maxsize=max_chunks)
+        self.buffer = bytearray()
+        self.aborted = threading.Event()
+
+    def _put(self, item):
+        while True:
+            if self.aborted.is_set():
+                raise UploadAborted("uploader stopped reading")
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.chunk_size:
+            self._put(bytes(self.buffer[:self.chunk_size]))
+            del self.buffer[:self.chunk_size]
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def finish(self, error=None):
+        # Called by the writer: hand over the tail, then end-of-archive or the error
+        if error is None and self.buffer:
+            self._put(bytes(self.buffer))
+        self.buffer.clear()
+        self._put(error if error is not None else _EOF)
+
+    def abort(self):
+        self.aborted.set()
+
+    def __iter__(self):
+        while True:
+            item = self.queue.get()
+            if item is _EOF:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+
+class LocalDirUploader:
+    # Stand-in uploader that "uploads" into a local folder (e.g. a mounted share)
+    def __init__(self, destination):
+        self.destination = destination
+        os.makedirs(destination, exist_ok=True)
+
+    def upload(self, name, chunks):
+        path = os.path.join(self.destination, name)
+        try:
+            with open(path + '.part', 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+        except BaseException:
+            os.remove(path + '.part')
+            raise
+        os.replace(path + '.part', path)
+        return path
+
+
+class S3Uploader:
+    # Multipart upload through a boto3-style S3 client (AWS, MinIO or any
+    # S3-compatible store). Chunks are regrouped into part_size parts; S3
+    # requires every part but the last to be at least 5 MB
+    def __init__(self, client, bucket, prefix='', part_size=8 << 20):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.part_size = max(part_size, 5 << 20)
+
+    def upload(self, name, chunks):
+        key = self.prefix + name
+        upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=key)['UploadId']
+        parts = []
+        buffer = bytearray()
+        try:
+            def send(body):
+                number = len(parts) + 1
+                response = self.client.upload_part(
+                    Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=number, Body=bytes(body)
+                )
+                parts.append({'ETag': response['ETag'], 'PartNumber': number})
+
+            for chunk in chunks:
+                buffer += chunk
+                if len(buffer) >= self.part_size:
+                    send(buffer)
+                    buffer.clear()
+            if buffer or not parts:
+                send(buffer)
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=key, UploadId=upload_id, MultipartUpload={'Parts': parts}
+            )
+        except BaseException:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+        return f"s3://{self.bucket}/{key}"
+
+
+def stream_zip(input_folder, names, archive_name, uploader, chunk_size=1 << 20, max_chunks=8, compresslevel=6):
+    # Build one archive straight into the uploader: a writer thread produces
+    # zip bytes into a ChunkPipe while this thread uploads them
+    pipe = ChunkPipe(chunk_size, max_chunks)
+
+    def produce():
+        try:
+            # The pipe can't seek, so zipfile writes sizes in data descriptors after each entry
+            with zipfile.ZipFile(pipe, 'w', zipfile.ZIP_DEFLATED, compresslevel=compresslevel) as zipf:
+                for name in names:
+                    extension = os.path.splitext(name)[1].lower()
+                    compression = zipfile.ZIP_STORED if extension in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+                    zipf.write(os.path.join(input_folder, name), name, compress_type=compression)
+        except UploadAborted:
+            return
+        except BaseException as e:
+            pipe.finish(e)
+            return
+        pipe.finish()
+
+    writer = threading.Thread(target=produce, daemon=True)
+    writer.start()
+    try:
+        return uploader.upload(archive_name, iter(pipe))
+    finally:
+        # If the upload failed, unblock the writer so it can exit
+        pipe.abort()
+        writer.join()
+
+
+def upload_zips(input_folder, veh_guid, imei, uploader, batch_size=10, max_batch_bytes=None,
+                workers=2, chunk_size=1 << 20, max_chunks=8, compresslevel=6,
+                incremental=False, settle_seconds=0):
+    # Like create_zips, but each archive is streamed to `uploader` as it is
+    # built instead of being written next to the images first. Up to
+    # `workers` archives are in flight, each buffering at most
+    # max_chunks * chunk_size bytes. The archive sequence and (when
+    # incremental) the watermark live in the input folder's state file
+    prefix = f"{veh_guid}_{imei}"
+    watermark_path = os.path.join(input_folder, f".{prefix}.upload.watermark.json")
+    watermark = load_watermark(watermark_path)
+    files = scan_files(input_folder, watermark if incremental else None, settle_seconds)
+    if not files:
+        return []
+    batches = plan_batches(files, batch_size, max_batch_bytes)
+    sequence = watermark.get('sequence', 0) + 1
+    timestamp = str(int(time.time()))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = []
+        for offset, batch in enumerate(batches):
+            archive_name = f"{prefix}_{sequence + offset:06d}_{timestamp}.zip"
+            futures.append(executor.submit(
+                stream_zip, input_folder, batch, archive_name, uploader, chunk_size, max_chunks, compresslevel
+            ))
+        uploaded = []
+        for future in futures:
+            uploaded.append(future.result())
+            print(f"Uploaded {uploaded[-1]}")
+
+    # Saved only once every archive is uploaded, so a failure re-sends the run
+    save_watermark(watermark_path, watermark, files, sequence + len(batches) - 1)
+    elapsed = time.perf_counter() - start
+    total_bytes = sum(size for _, size, _ in files)
+    print(f"Streamed {len(files)} files ({total_bytes / 1e6:.1f} MB) in {len(uploaded)} archives in {elapsed:.1f}s")
+    return uploaded
+
+
+def watch_folder(input_folder, veh_guid, imei, interval=30, settle_seconds=5, **zip_options):
+    # Long-running incremental packer. With inotify_simple installed it wakes as
+    # soon as files are written or moved into the folder; otherwise it polls
+    # every `interval` seconds. Either way each pass is one scandir of the folder
+    try:
+        from inotify_simple import INotify, flags
+        inotify = INotify()
+        inotify.add_watch(input_folder, flags.CLOSE_WRITE | flags.MOVED_TO)
+    except (ImportError, OSError):
+        inotify = None
+    print(f"Watching {input_folder} ({'inotify' if inotify else 'polling'})")
+
+    while True:
+        try:
+            create_zips(input_folder, veh_guid, imei, incremental=True, settle_seconds=settle_seconds, **zip_options)
+        except OSError as e:
+            # The watermark only moves after a whole pass succeeds, so the
+            # next wake packs these files again and nothing is lost
+            print(f"Packing pass failed, retrying on the next wake: {e}")
+        if inotify is None:
+            time.sleep(interval)
+            continue
+        # Wait for a new input (our own .zip and watermark renames also raise
+        # events, so they're filtered), then let a burst of writes finish
+        while True:
+            events = inotify.read(timeout=interval * 1000)
+            if not events or any(is_input_name(e.name) for e in events):
+                break
+        time.sleep(settle_seconds)
+
+
+if __name__ == "__main__":
+    # Example usage
+    input_folder = "/home/narravenkataraghucharan/Downloads/Spy-2/Spy"  # Replace with the path to your folder
+    veh_guid = "VEHherom-otoc-orpp-ocHM-C$0000000001"                    # Replace with your vehGuid
+    imei = "67r8r"                           # Replace with your imei
+    create_zips(input_folder, veh_guid, imei)